@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 
@@ -88,9 +89,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Seconds a LazyTokenUser's User row is reused by the same process.
+OLCHA_USER_CACHE_TTL = 30
+
+# Applied to every new SQLite connection; see olcha/sqlite.py.
+OLCHA_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -135,6 +154,18 @@ STATICFILES_DIRS = [
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, '/media/')
+
+# Image fields store uploads by content hash; see olcha/media.py.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'media': {'BACKEND': 'olcha.media.ContentAddressedStorage'},
+}
+
+# None streams media from Django; 'x-sendfile' or 'x-accel-redirect' hands the file to the web server.
+OLCHA_MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+# nginx ``internal`` location aliased to MEDIA_ROOT, for X-Accel-Redirect.
+OLCHA_MEDIA_ACCEL_PREFIX = '/protected-media/'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -147,14 +178,47 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Builds request.user from the token claims; see olcha.authentication.LazyTokenUser.
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
         # 'rest_framework.authentication.TokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS':'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 1000,
+
+    # Used by the login/register views (olcha.throttles).
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '30/min',
+        'login_username': '10/min',
+        'register': '10/min',
+    },
 }
 
+# Widths of the WebP/JPEG variants rendered for uploaded images, and the threads rendering them; see olcha/images.py.
+OLCHA_IMAGE_WIDTHS = (160, 320, 640, 1280)
+OLCHA_IMAGE_WORKERS = 2
+
+# Outbox task queue for signal side effects; see olcha/tasks.py. Each process drains it with an in-process worker
+# thread unless started with TASK_WORKER=0, e.g. when manage.py run_tasks runs as the dedicated worker. Tests keep
+# their rows in uncommitted transactions, so they drain the queue with run_pending() instead.
+OLCHA_TASK_WORKER = os.environ.get('TASK_WORKER', '1') != '0' and sys.argv[1:2] != ['test']
+OLCHA_TASK_POLL = 5
+OLCHA_TASK_BATCH_SIZE = 200
+OLCHA_TASK_LEASE = 60
+OLCHA_TASK_MAX_ATTEMPTS = 5
+OLCHA_TASK_RETRY_DELAY = 2
+# Seconds a task that used up its attempts is kept for inspection before it is pruned.
+OLCHA_TASK_RETENTION = 7 * 24 * 3600
+
+# Password hashing process pool and login cache; see olcha/passwords.py.
+OLCHA_PASSWORD_WORKERS = 2
+OLCHA_PASSWORD_QUEUE = 32
+OLCHA_PASSWORD_TIMEOUT = 10
+OLCHA_LOGIN_CACHE_TTL = 300
+
+# Full-text product search; use olcha.search.DatabaseSearchBackend on databases without FTS5.
+OLCHA_SEARCH_BACKEND = 'olcha.search.SQLiteFTSBackend'
+
 
 
 SIMPLE_JWT = {
@@ -181,7 +245,7 @@ SIMPLE_JWT = {
 
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
-    "TOKEN_USER_CLASS": "rest_framework_simplejwt.models.TokenUser",
+    "TOKEN_USER_CLASS": "olcha.authentication.LazyTokenUser",
 
     "JTI_CLAIM": "jti",
 
@@ -205,9 +269,26 @@ INTERNAL_IPS = [
 
 
 
+# An in-process LRU (bounded, entries expire locally after LOCAL_TIMEOUT seconds) in front of a shared tier.
+# The shared tier is Redis when REDIS_URL is set and a file cache otherwise, so cache traffic never
+# contends with application writes on db.sqlite3.
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
-        "LOCATION": "my_cache_table",
-    }
+        "BACKEND": "olcha.cache_backends.TieredCache",
+        "LOCATION": "olcha-local",
+        "OPTIONS": {
+            "SHARED": "shared",
+            "LOCAL_MAX_ENTRIES": 1000,
+            "LOCAL_MAX_BYTES": 32 * 1024 * 1024,
+            "LOCAL_TIMEOUT": 5,
+        },
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    } if os.environ.get("REDIS_URL") else {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
 }
\ No newline at end of file
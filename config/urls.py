@@ -1,9 +1,8 @@
 from django.contrib import admin
 from django.contrib.messages import api
 from django.urls import path, include
-from django.conf.urls.static import static
 from config import settings
-from config.settings import MEDIA_URL
+from olcha.media import serve_media
 from rest_framework.authtoken import views
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -20,6 +19,7 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
-] + static(MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path(settings.MEDIA_URL.lstrip('/') + '<path:path>', serve_media, name='media'),
+]
 
 urlpatterns += [path('__debug__/', include('debug_toolbar.urls'))]
\ No newline at end of file
@@ -0,0 +1,95 @@
+import asyncio
+
+from django.core.exceptions import BadRequest
+from django.db.models import Count
+from django.http import JsonResponse, Http404
+
+from olcha.compact import image_url, iso_datetime
+from olcha.images import srcset
+from olcha.models import Category, SubCategory, Product, ProductAttribute, Image, Comment
+
+# Native async read endpoints for the catalog. They return the same documents as the DRF
+# serializers but run on the event loop under ASGI instead of taking a thread-pool hop per request.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+PRODUCT_FIELDS = ('id', 'name', 'price', 'quantity', 'discount', 'description', 'rating', 'slug')
+
+
+def product_row(row):
+    return dict(row, price=f"{row['price']:.2f}")
+
+
+def page(request, queryset):
+    """``?after=<id>&limit=<n>`` keyset slice ordered by id."""
+    try:
+        limit = max(1, min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        raise BadRequest('limit and after must be integers.')
+    return queryset.filter(id__gt=after).order_by('id')[:limit]
+
+
+async def category_list(request):
+    categories = page(request, Category.objects.annotate(subcategories=Count('sub_categories')))
+    results = [
+        dict(row, image=image_url(request, row['image']), srcset=srcset(request, row['image']))
+        async for row in categories.values('id', 'name', 'image', 'slug', 'subcategories')
+    ]
+    return JsonResponse({'results': results})
+
+
+async def sub_category_list(request, category_id=None):
+    sub_categories = SubCategory.objects.all()
+    if category_id:
+        sub_categories = sub_categories.filter(category_id=category_id)
+    results = [
+        dict(row, image=image_url(request, row['image']), srcset=srcset(request, row['image']))
+        async for row in page(request, sub_categories).values('id', 'name', 'image', 'slug')
+    ]
+    return JsonResponse({'results': results})
+
+
+async def product_list(request, category_id=None, subcategory_id=None):
+    products = Product.objects.all()
+    if category_id:
+        products = products.filter(sub_category__category_id=category_id)
+    if subcategory_id:
+        products = products.filter(sub_category_id=subcategory_id)
+    results = [product_row(row) async for row in page(request, products).values(*PRODUCT_FIELDS)]
+    return JsonResponse({'results': results})
+
+
+async def product_detail(request, pk):
+    async def attributes():
+        rows = ProductAttribute.objects.filter(product_id=pk).order_by('id').values(
+            'attribute__name', 'attribute_value__value'
+        )
+        return [
+            {'attribute': {'name': row['attribute__name']}, 'attribute_value': {'value': row['attribute_value__value']}}
+            async for row in rows
+        ]
+
+    async def images():
+        rows = Image.objects.filter(product_id=pk).order_by('id').values_list('image', flat=True)
+        return [{'image': image_url(request, name), 'srcset': srcset(request, name)} async for name in rows]
+
+    async def comments():
+        rows = Comment.objects.filter(product_id=pk).order_by('id').values(
+            'user__username', 'comment', 'rating', 'created_at'
+        )
+        return [
+            {'username': row['user__username'], 'comment': row['comment'], 'rating': row['rating'],
+             'created_at': iso_datetime(row['created_at'])}
+            async for row in rows
+        ]
+
+    try:
+        product, product_attribute, image, comment_rows = await asyncio.gather(
+            Product.objects.values(*PRODUCT_FIELDS).aget(pk=pk), attributes(), images(), comments()
+        )
+    except Product.DoesNotExist:
+        raise Http404
+    return JsonResponse(dict(
+        product_row(product), image=image, comments=comment_rows, product_attribute=product_attribute
+    ))
@@ -0,0 +1,76 @@
+import threading
+
+from django.db import transaction
+
+from olcha.cache import get_model_versions, bump_model_version
+from olcha.models import Attribute, AttributeValue
+
+# Version scope bumped only when a name stops pointing at its id (rename or delete).
+NAMES_SCOPE = 'names'
+
+
+class NameInterner:
+    """
+    Canonical ``name -> id`` dictionary for a model with a unique name column.
+
+    Resolved names are kept in an in-process dict, so repeated imports and
+    lookups of the same "Color"/"Red" cost no queries. The dict is dropped
+    whenever any process renames or deletes a row (olcha.signals bumps the
+    ``names`` version), which is the only way a cached id can go stale.
+    """
+    max_entries = 100_000
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self.ids = {}
+        self.version = None
+        self.lock = threading.Lock()
+
+    def cached(self, names):
+        version = get_model_versions([self.model], NAMES_SCOPE)[0]
+        with self.lock:
+            if version != self.version or len(self.ids) > self.max_entries:
+                self.ids, self.version = {}, version
+            return {name: self.ids[name] for name in names if name in self.ids}
+
+    def remember(self, ids):
+        with self.lock:
+            self.ids.update(ids)
+
+    def fetch(self, names):
+        return dict(self.model.objects.filter(**{f'{self.field}__in': names}).values_list(self.field, 'id'))
+
+    def lookup(self, names):
+        """``{name: id}`` for the names that exist; unknown names are left out."""
+        names = set(names)
+        ids = self.cached(names)
+        missing = names - ids.keys()
+        if missing:
+            found = self.fetch(missing)
+            self.remember(found)
+            ids.update(found)
+        return ids
+
+    def get_or_create(self, names):
+        """``{name: id}`` for every name, inserting the missing ones with one bulk INSERT."""
+        names = set(names)
+        ids = self.lookup(names)
+        missing = names - ids.keys()
+        if missing:
+            # ignore_conflicts: a concurrent writer may insert the same name first; the re-read picks up its id.
+            self.model.objects.bulk_create([self.model(**{self.field: name}) for name in missing],
+                                           ignore_conflicts=True)
+            created = self.fetch(missing)
+            ids.update(created)
+            # Only cache the new ids once they are committed; a rolled-back import must not leave them behind.
+            transaction.on_commit(lambda: self.remember(created))
+            bump_model_version(self.model)
+        return ids
+
+    def forget(self):
+        bump_model_version(self.model, scope=NAMES_SCOPE)
+
+
+attribute_names = NameInterner(Attribute, 'name')
+attribute_values = NameInterner(AttributeValue, 'value')
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+
+
+class UserCache:
+    """
+    Short-lived in-process ``id -> User`` cache behind LazyTokenUser.
+
+    Entries live for ``OLCHA_USER_CACHE_TTL`` seconds; olcha.signals drops a
+    user as soon as this process saves or deletes it, other processes pick
+    the change up when the entry expires. Cached users are shared between
+    requests, so treat them as read-only.
+    """
+    max_entries = 10_000
+
+    def __init__(self):
+        self.users = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            expires, user = self.users.get(user_id, (0, None))
+        if expires <= now:
+            try:
+                user = User.objects.get(pk=user_id)
+            except User.DoesNotExist:
+                raise AuthenticationFailed('User not found', code='user_not_found')
+            with self.lock:
+                if len(self.users) >= self.max_entries:
+                    self.users.clear()
+                self.users[user_id] = (now + settings.OLCHA_USER_CACHE_TTL, user)
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
+
+    def forget(self, user_id):
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+
+
+user_cache = UserCache()
+
+
+class LazyTokenUser(TokenUser):
+    """
+    ``request.user`` built from the access token's claims alone.
+
+    ``id``/``pk`` come from the token, so owner filters and per-user cache
+    keys cost no query. Anything the token does not carry (``username``,
+    staff flags, permissions) loads the User row on first use, through
+    ``user_cache``.
+    """
+
+    @cached_property
+    def user(self):
+        return user_cache.get(self.id)
+
+    @cached_property
+    def username(self):
+        return self.user.username
+
+    @cached_property
+    def is_staff(self):
+        return self.user.is_staff
+
+    @cached_property
+    def is_superuser(self):
+        return self.user.is_superuser
+
+    def has_perm(self, perm, obj=None):
+        return self.user.has_perm(perm, obj)
+
+    def has_perms(self, perm_list, obj=None):
+        return self.user.has_perms(perm_list, obj)
+
+    def has_module_perms(self, module):
+        return self.user.has_module_perms(module)
+
+
+def get_full_user(user):
+    """The User row behind ``request.user``, for writes that need a real foreign key target."""
+    return user.user if isinstance(user, LazyTokenUser) else user
@@ -0,0 +1,164 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+PRODUCT_DETAIL_TIMEOUT = 60 * 60
+PRODUCT_DETAIL_ORIGINS = 4
+RESPONSE_TIMEOUT = 60 * 60 * 6
+
+
+def product_detail_key(product_id):
+    return f'olcha:product-detail:{product_id}'
+
+
+def get_product_detail(product_id, origin):
+    """
+    The cached document of a product as served to ``origin`` (scheme and host).
+
+    Documents embed absolute media URLs, so one is kept per origin, all
+    under the product's key, which lets invalidation drop every origin with
+    one delete. Only the ``PRODUCT_DETAIL_ORIGINS`` most recent are kept.
+    """
+    return (cache.get(product_detail_key(product_id)) or {}).get(origin)
+
+
+def set_product_detail(product_id, origin, data):
+    key = product_detail_key(product_id)
+    documents = cache.get(key) or {}
+    documents.pop(origin, None)
+    documents = dict(list(documents.items())[-(PRODUCT_DETAIL_ORIGINS - 1):], **{origin: data})
+    cache.set(key, documents, PRODUCT_DETAIL_TIMEOUT)
+
+
+def invalidate_product_detail(*product_ids):
+    """Drop the cached documents once the current transaction commits (right away outside one)."""
+    keys = [product_detail_key(product_id) for product_id in set(product_ids)]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+# ----------------------------------------- Versioned responses -----------------------------------------
+
+def model_version_key(model, scope=None):
+    key = f'olcha:version:{model._meta.label_lower}'
+    return key if scope is None else f'{key}:{scope}'
+
+
+def version_store():
+    """
+    The backend holding table versions: TieredCache's shared tier.
+
+    Every process has to see a bump as soon as it is made, so versions are
+    never copied into the per-process local tier, whose entries would hide
+    other processes' writes for up to LOCAL_TIMEOUT seconds.
+    """
+    return getattr(cache, 'shared', cache)
+
+
+def get_model_versions(models, scope=None):
+    """
+    Current version of every model's table.
+
+    A version is the time of the table's last write in nanoseconds. A
+    missing version (first use, or evicted) starts from the current time,
+    which no older cached response can have been stored under.
+    """
+    store = version_store()
+    keys = [model_version_key(model, scope) for model in models]
+    versions = store.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            store.add(key, time.time_ns(), None)
+            versions[key] = store.get(key, time.time_ns())
+    return [versions[key] for key in keys]
+
+
+def bump_model_version(*models, scope=None):
+    """
+    Move the models' versions on once the current transaction commits.
+
+    Bumping earlier would let a concurrent reader cache the pre-commit rows
+    under the new version, where they would outlive the write.
+    """
+    keys = [model_version_key(model, scope) for model in models]
+    transaction.on_commit(lambda: version_store().set_many(dict.fromkeys(keys, time.time_ns()), None))
+
+
+def request_user_id(request):
+    """The ``user_id`` claim of a valid JWT on a plain Django request, without touching the database."""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token).get(jwt_settings.USER_ID_CLAIM)
+    except InvalidToken:
+        return None
+
+
+def response_cache_key(request, versions, user_id=None):
+    request_id = '|'.join((request.get_host(), request.get_full_path(), request.META.get('HTTP_ACCEPT', '')))
+    digest = hashlib.md5(request_id.encode(), usedforsecurity=False).hexdigest()
+    key = f"olcha:response:{digest}:{'.'.join(str(version) for version in versions)}"
+    return key if user_id is None else f'{key}:user:{user_id}'
+
+
+def set_etag(response, etag):
+    response.headers['ETag'] = etag
+    return response
+
+
+def versioned_cache_page(*models, per_user=(), timeout=RESPONSE_TIMEOUT):
+    """
+    Like ``cache_page``, but the key embeds the table versions of ``models``.
+
+    olcha.signals bumps a model's version on every write, which orphans all
+    cached responses built from it, so the TTL can be long without serving
+    stale prices, stock or reviews.
+
+    Views over ``per_user`` models are cached per JWT principal, under
+    versions that only that user's writes bump; requests without a valid
+    token are never cached.
+
+    The same versions give every response an ETag, so a conditional request
+    is answered with 304 before the view, the database or the response
+    cache is touched. There is deliberately no Last-Modified: HTTP dates
+    have one-second precision, and a write in the same second as the
+    cached response would still be answered with 304.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+            user_id = request_user_id(request) if per_user else None
+            if per_user and user_id is None:
+                return view_func(request, *args, **kwargs)
+            versions = get_model_versions(models) + get_model_versions(per_user, user_id)
+            key = response_cache_key(request, versions, user_id)
+            etag = quote_etag(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return set_etag(not_modified, etag)
+
+            response = cache.get(key)
+            if response is not None:
+                return response
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                set_etag(response, etag)
+                if callable(getattr(response, 'render', None)):
+                    response.add_post_render_callback(lambda rendered: cache.set(key, rendered, timeout))
+                else:
+                    cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
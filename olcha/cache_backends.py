@@ -0,0 +1,165 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+# Django builds one backend instance per thread; like LocMemCache, the LRU itself is shared per process.
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """Thread-safe LRU of pickled values bounded by entry count and total size."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = dict.fromkeys(('local_hits', 'local_misses', 'shared_hits', 'shared_misses', 'evictions'), 0)
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.stats['local_hits'] += 1
+                return entry[1]
+            if entry is not None:
+                self._pop(key)
+            self.stats['local_misses'] += 1
+        return None
+
+    def set(self, key, pickled, lifetime):
+        if lifetime <= 0 or len(pickled) > self.max_bytes:
+            self.delete(key)
+            return
+        with self.lock:
+            self._pop(key)
+            self.entries[key] = (time.monotonic() + lifetime, pickled)
+            self.size += len(pickled)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats['evictions'] += 1
+
+    def delete(self, key):
+        with self.lock:
+            self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class TieredCache(BaseCache):
+    """
+    A bounded in-process LRU in front of a shared cache alias.
+
+    Reads are served from the local tier when possible and fall through to
+    the shared tier, whose hits are copied back locally. Writes and deletes
+    go to both tiers. Other processes only see a delete once their local
+    copy expires, so local entries live at most ``LOCAL_TIMEOUT`` seconds.
+
+    OPTIONS:
+        SHARED              alias of the shared backend (required)
+        LOCAL_MAX_ENTRIES   LRU entry limit (default 1000)
+        LOCAL_MAX_BYTES     LRU size limit of the pickled values (default 32 MiB)
+        LOCAL_TIMEOUT       upper bound on a local entry's lifetime (default 5)
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options['SHARED']
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        with _local_tiers_lock:
+            self.local = _local_tiers.setdefault(location, LocalTier(
+                options.get('LOCAL_MAX_ENTRIES', 1000), options.get('LOCAL_MAX_BYTES', 32 * 1024 * 1024)
+            ))
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def stats(self):
+        with self.local.lock:
+            return dict(self.local.stats, local_entries=len(self.local.entries), local_bytes=self.local.size)
+
+    def reset_stats(self):
+        with self.local.lock:
+            self.local.stats = dict.fromkeys(self.local.stats, 0)
+
+    def _keep_locally(self, local_key, value, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        lifetime = self.local_timeout if timeout is None else min(timeout, self.local_timeout)
+        self.local.set(local_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), lifetime)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        pickled = self.local.get(local_key)
+        if pickled is not None:
+            return pickle.loads(pickled)
+        missing = object()
+        value = self.shared.get(key, missing, version=version)
+        if value is missing:
+            self.local.count('shared_misses')
+            return default
+        self.local.count('shared_hits')
+        self._keep_locally(local_key, value, None)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, timeout, version=version)
+        self._keep_locally(local_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._keep_locally(local_key, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self.local.delete(self.make_and_validate_key(key, version=version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self.local.get(self.make_and_validate_key(key, version=version)) is not None:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters must be atomic across processes, so they live in the shared tier only.
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
@@ -0,0 +1,86 @@
+import decimal
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from olcha.media import media_storage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def image_url(request, name):
+    """What DRF's ImageField returns for a stored file name."""
+    if not name:
+        return None
+    url = media_storage().url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def iso_datetime(value):
+    """What DRF's DateTimeField returns: current time zone, ISO 8601, ``Z`` for UTC."""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class CompactJSONEncoder(JSONEncoder):
+    """DRF's encoder, except Decimals keep their exact digits as strings, like DecimalField output."""
+
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return format(obj, 'f')
+        return super().default(obj)
+
+
+encode_default = CompactJSONEncoder().default
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer with native Decimal support, rendered by orjson when it is installed.
+
+    Output matches JSONRenderer for serializer data; rows from a
+    CompactSerializer may carry Decimals, which come out as DecimalField does.
+    """
+    encoder_class = CompactJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        # Same strict-javascript-subset escaping as JSONRenderer.
+        if b'\xe2\x80' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
+
+
+class CompactSerializer:
+    """
+    Builds a list serializer's output straight from ``.values()`` rows.
+
+    ``columns`` maps each output field to the lookup it is read from, in
+    output order; a ``fields`` context entry narrows them like
+    SparseFieldsMixin does. ``to_representation`` turns one row into the
+    output dict; override it for fields whose representation differs from
+    the column.
+    """
+    columns = {}
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        selected = self.context.get('fields')
+        self.fields = {field: column for field, column in self.columns.items() if selected is None or field in selected}
+
+    def values(self, queryset, *extra):
+        return queryset.values(*dict.fromkeys((*self.fields.values(), *extra)))
+
+    def to_representation(self, row):
+        return {field: row[column] for field, column in self.fields.items()}
+
+    def represent(self, rows):
+        return [self.to_representation(row) for row in rows]
@@ -0,0 +1,111 @@
+import itertools
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from olcha.models import Product, ProductTombstone
+
+EXPORT_FIELDS = (
+    'id', 'name', 'slug', 'price', 'quantity', 'discount', 'description', 'rating',
+    'sub_category_id', 'created_at', 'updated_at',
+)
+EXPORT_FORMATS = ('ndjson', 'json')
+CHUNK_SIZE = 2000
+
+encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def parse_since(value):
+    """``?since=`` as an aware datetime; ``None`` when it is empty, ``ValueError`` when it is not a datetime."""
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f'Expected an ISO 8601 datetime, got {value!r}.')
+    return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an ``Accept-Encoding`` header allows gzip, honouring q-values (``gzip;q=0`` refuses it)."""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0.0))) > 0
+
+
+def export_rows(since=None, chunk_size=CHUNK_SIZE):
+    """
+    Catalog rows as dicts, fetched ``chunk_size`` at a time.
+
+    ``.values()`` with ``iterator()`` skips model instances and the queryset
+    result cache, so memory is bounded by one chunk whatever the catalog size.
+    With ``since`` only products written at or after it are returned,
+    followed by ``{"id": ..., "deleted": true, "updated_at": ...}`` for every
+    product deleted since then.
+    """
+    products = Product.objects.order_by('id')
+    if since is None:
+        return products.values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    products = products.filter(updated_at__gte=since).values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    tombstones = ProductTombstone.objects.filter(created_at__gte=since).order_by('product_id').values_list(
+        'product_id', 'created_at'
+    ).iterator(chunk_size=chunk_size)
+    return itertools.chain(products, (
+        {'id': product_id, 'deleted': True, 'updated_at': deleted_at} for product_id, deleted_at in tombstones
+    ))
+
+
+def ndjson_chunks(rows):
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def json_chunks(rows):
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + encoder.encode(row)
+        separator = ','
+    yield ']\n'
+
+
+def encode_chunks(chunks, batch_bytes=64 * 1024):
+    """Join small text chunks into ``batch_bytes`` byte strings so the server writes a few large frames."""
+    batch, size = [], 0
+    for chunk in chunks:
+        chunk = chunk.encode()
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= batch_bytes:
+            yield b''.join(batch)
+            batch, size = [], 0
+    if batch:
+        yield b''.join(batch)
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_catalog(export_format='ndjson', since=None, compress=False, chunk_size=CHUNK_SIZE):
+    """Byte chunks of the catalog in ``export_format``, gzip-compressed when ``compress`` is set."""
+    serialize = json_chunks if export_format == 'json' else ndjson_chunks
+    chunks = encode_chunks(serialize(export_rows(since, chunk_size)))
+    return gzip_chunks(chunks) if compress else chunks
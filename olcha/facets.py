@@ -0,0 +1,128 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from olcha.attributes import attribute_names, attribute_values
+from olcha.cache import bump_model_version
+from olcha.models import FacetCount, ProductAttribute, Product
+
+FACET_PARAM = 'attr'
+
+
+def parse_facet_filters(query_params):
+    """
+    ``?attr=<attribute>:<value>`` (repeatable) -> ``{attribute_id: {value_id, ...}}``.
+
+    Both parts are ids or names (``?attr=Color:Red``); names resolve through
+    the interned attribute dictionary, so they usually cost no query.
+    """
+    selected = defaultdict(set)
+    named = []
+    for raw in query_params.getlist(FACET_PARAM):
+        parts = [part.strip() for part in raw.split(':')]
+        if len(parts) != 2 or not all(parts):
+            raise ValidationError({FACET_PARAM: f'Expected <attribute>:<value>, got {raw!r}.'})
+        attribute, value = parts
+        if attribute.isdigit() and value.isdigit():
+            selected[int(attribute)].add(int(value))
+        else:
+            named.append((attribute, value))
+    if named:
+        attribute_ids = attribute_names.lookup({attribute for attribute, value in named})
+        value_ids = attribute_values.lookup({value for attribute, value in named})
+        for attribute, value in named:
+            # An unknown name maps to id 0, which matches no product.
+            selected[attribute_ids.get(attribute, 0)].add(value_ids.get(value, 0))
+    return selected
+
+
+def filter_products(queryset, selected):
+    # Values of one attribute are OR-ed, different attributes are AND-ed.
+    for attribute_id, value_ids in selected.items():
+        queryset = queryset.filter(pk__in=ProductAttribute.objects.filter(
+            attribute_id=attribute_id, attribute_value_id__in=value_ids
+        ).values('product_id'))
+    return queryset
+
+
+def group_facets(rows):
+    facets = {}
+    for row in rows:
+        facet = facets.setdefault(row['attribute_id'], {
+            'attribute_id': row['attribute_id'], 'attribute': row['attribute__name'], 'values': [],
+        })
+        facet['values'].append({
+            'id': row['attribute_value_id'], 'value': row['attribute_value__value'], 'count': row['count'],
+        })
+    for facet in facets.values():
+        facet['values'].sort(key=lambda value: (-value['count'], value['value']))
+    return sorted(facets.values(), key=lambda facet: facet['attribute'])
+
+
+FACET_COLUMNS = ('attribute_id', 'attribute__name', 'attribute_value_id', 'attribute_value__value')
+
+
+def precomputed_facets(category_id=None, sub_category_id=None):
+    counts = FacetCount.objects.filter(product_count__gt=0)
+    if sub_category_id:
+        counts = counts.filter(sub_category_id=sub_category_id)
+    elif category_id:
+        counts = counts.filter(sub_category__category_id=category_id)
+    return group_facets(counts.values(*FACET_COLUMNS).annotate(count=Sum('product_count')).order_by())
+
+
+def live_facets(queryset):
+    rows = ProductAttribute.objects.filter(product__in=queryset.order_by().values('pk'))
+    return group_facets(rows.values(*FACET_COLUMNS).annotate(count=Count('product', distinct=True)).order_by())
+
+
+def adjust_facet_count(sub_category_id, attribute_id, attribute_value_id, delta):
+    counts = FacetCount.objects.filter(
+        sub_category_id=sub_category_id, attribute_id=attribute_id, attribute_value_id=attribute_value_id
+    )
+    if counts.update(product_count=F('product_count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            FacetCount.objects.create(
+                sub_category_id=sub_category_id, attribute_id=attribute_id,
+                attribute_value_id=attribute_value_id, product_count=delta,
+            )
+    except IntegrityError:
+        # Another writer created the row between our UPDATE and INSERT.
+        counts.update(product_count=F('product_count') + delta)
+
+
+def adjust_product_facets(product_id, attribute_id, attribute_value_id, delta):
+    sub_category_id = Product.objects.filter(pk=product_id).values_list('sub_category_id', flat=True).first()
+    if sub_category_id is not None:
+        adjust_facet_count(sub_category_id, attribute_id, attribute_value_id, delta)
+
+
+def rebuild_facet_counts(sub_category_ids=None):
+    """Recount from ProductAttribute with one GROUP BY and replace the affected rows."""
+    links = ProductAttribute.objects.all()
+    counts = FacetCount.objects.all()
+    if sub_category_ids is not None:
+        links = links.filter(product__sub_category_id__in=sub_category_ids)
+        counts = counts.filter(sub_category_id__in=sub_category_ids)
+    rows = links.values('product__sub_category_id', 'attribute_id', 'attribute_value_id').annotate(
+        total=Count('product', distinct=True)
+    ).order_by()
+    with transaction.atomic():
+        counts.delete()
+        created = FacetCount.objects.bulk_create([
+            FacetCount(sub_category_id=row['product__sub_category_id'], attribute_id=row['attribute_id'],
+                       attribute_value_id=row['attribute_value_id'], product_count=row['total'])
+            for row in rows.iterator()
+        ], batch_size=1000)
+    bump_model_version(ProductAttribute)
+    return len(created)
+
+
+class AttributeFacetFilter(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        return filter_products(queryset, parse_facet_filters(request.query_params))
@@ -0,0 +1,122 @@
+"""
+Resized WebP/JPEG variants of uploaded images.
+
+Every variant of ``images/phone.png`` has a fixed name
+(``variants/images/phone.320w.webp``), so serializers build ``srcset``
+from the stored name alone, without queries. Variants are rendered in a
+thread pool after the upload commits (olcha.signals); ``manage.py
+generate_image_variants`` backfills existing media. Images narrower than a
+width are not upscaled; the variant keeps the original size.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image as PILImage, ImageOps
+
+from olcha.compact import image_url
+from olcha.media import VARIANTS_PREFIX, media_storage
+
+logger = logging.getLogger(__name__)
+
+# srcset key -> (Pillow format, extension, save options)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(name, width, variant_format):
+    root, _ = os.path.splitext(name)
+    return f'{VARIANTS_PREFIX}{root}.{width}w.{VARIANT_FORMATS[variant_format][1]}'
+
+
+def srcset(request, name):
+    """``{'webp': 'url 160w, ...', 'jpeg': ...}`` for a stored image name, or None without an image."""
+    if not name:
+        return None
+    return {
+        variant_format: ', '.join(
+            f'{image_url(request, variant_name(name, width, variant_format))} {width}w'
+            for width in settings.OLCHA_IMAGE_WIDTHS
+        )
+        for variant_format in VARIANT_FORMATS
+    }
+
+
+def render_variants(name, force=False, storage=None):
+    """Write the missing variants of ``name``, by default in the image fields' storage; returns how many."""
+    storage = storage or media_storage()
+    targets = [
+        (width, variant_format, variant_name(name, width, variant_format))
+        for width in settings.OLCHA_IMAGE_WIDTHS for variant_format in VARIANT_FORMATS
+    ]
+    if not force:
+        targets = [target for target in targets if not storage.exists(target[2])]
+    if not targets:
+        return 0
+    with storage.open(name) as file, PILImage.open(file) as original:
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    has_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+    sources = {
+        'webp': original.convert('RGBA' if has_alpha else 'RGB'),
+        # JPEG has no alpha channel; flatten onto white instead of letting transparent pixels turn black.
+        'jpeg': flatten(original) if has_alpha else original.convert('RGB'),
+    }
+    for width, variant_format, target in targets:
+        image = sources[variant_format]
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), PILImage.LANCZOS)
+        pillow_format, _, options = VARIANT_FORMATS[variant_format]
+        buffer = io.BytesIO()
+        image.save(buffer, pillow_format, **options)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(buffer.getvalue()))
+    return len(targets)
+
+
+def flatten(image):
+    background = PILImage.new('RGB', image.size, (255, 255, 255))
+    background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+    return background
+
+
+class VariantPool:
+    """Renders variants off the request thread; ``OLCHA_IMAGE_WORKERS = 0`` renders inline."""
+
+    def __init__(self):
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def submit(self, name):
+        if not settings.OLCHA_IMAGE_WORKERS:
+            return self.render(name)
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(settings.OLCHA_IMAGE_WORKERS, thread_name_prefix='image-variants')
+        return self.executor.submit(self.render, name)
+
+    def render(self, name):
+        try:
+            return render_variants(name)
+        except FileNotFoundError:
+            logger.info(f'{name} is not in storage; no variants rendered')
+            return 0
+        except Exception:
+            logger.exception(f'Could not render variants of {name}')
+            return 0
+
+
+pool = VariantPool()
+
+
+def schedule_variants(name):
+    if name:
+        transaction.on_commit(lambda: pool.submit(name))
@@ -0,0 +1,229 @@
+import codecs
+import csv
+import json
+import time
+from itertools import islice
+
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import BaseParser
+
+from olcha.attributes import attribute_names, attribute_values
+from olcha.cache import invalidate_product_detail, bump_model_version
+from olcha.facets import rebuild_facet_counts
+from olcha.models import Product, SubCategory, ProductAttribute
+from olcha.search import get_search_backend
+from olcha.serializer import ProductImportRowSerializer
+from olcha.slugs import unique_slugs
+
+BATCH_SIZE = 1000
+# Ids per DELETE, under SQLite's 999 bound parameters.
+DELETE_CHUNK = 500
+IMPORT_FORMATS = ('csv', 'ndjson')
+UPDATE_FIELDS = ('name', 'price', 'quantity', 'discount', 'description', 'sub_category', 'updated_at')
+MAX_REPORTED_ERRORS = 100
+
+
+def parse_attributes(value):
+    """CSV ``attributes`` cell, ``Color=Red;Size=XL`` -> ``{'Color': 'Red', 'Size': 'XL'}``."""
+    try:
+        return dict((part.strip() for part in pair.split('=', 1)) for pair in value.split(';') if pair.strip())
+    except ValueError:
+        return value
+
+
+def csv_rows(lines):
+    """``(line number, row)`` pairs; empty cells are left out so serializer defaults apply."""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        row = {key: value for key, value in row.items() if key and value not in (None, '')}
+        if 'attributes' in row:
+            row['attributes'] = parse_attributes(row['attributes'])
+        yield reader.line_num, row
+
+
+def ndjson_rows(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def read_rows(lines, import_format):
+    return csv_rows(lines) if import_format == 'csv' else ndjson_rows(lines)
+
+
+class ProductImporter:
+    """
+    Upserts products from ``(line number, row)`` pairs, ``batch_size`` rows at a time.
+
+    Each batch is validated, resolved and written with a fixed number of
+    queries: every row goes through one ``bulk_create`` upsert keyed on
+    ``slug``, and rows without a slug get a free one first. Rows given
+    ``attributes`` have their attribute links replaced. Invalid rows are
+    skipped and reported; every other row of the batch is written in one
+    transaction.
+
+    Bulk writes bypass olcha.signals, so the search index, facet counts,
+    detail cache and response versions are refreshed once per batch here.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.rows = self.created = self.updated = 0
+        self.errors = []
+        self.failed = 0
+        self.seconds = 0.0
+
+    def run(self, rows):
+        start = time.perf_counter()
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            self.rows += len(batch)
+            self.import_batch(batch)
+        self.seconds = time.perf_counter() - start
+        return self.report()
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows / self.seconds) if self.seconds else 0,
+            'errors': self.errors[:MAX_REPORTED_ERRORS],
+        }
+
+    def reject(self, number, errors):
+        self.failed += 1
+        self.errors.append({'row': number, 'errors': errors})
+
+    def validate(self, batch):
+        # One serializer validates the whole batch, so its fields are built once rather than once per row.
+        serializer = ProductImportRowSerializer()
+        valid = []
+        for number, row in batch:
+            try:
+                valid.append((number, serializer.run_validation(row)))
+            except ValidationError as error:
+                self.reject(number, error.detail)
+        return valid
+
+    def resolve_sub_categories(self, rows):
+        refs = {data['sub_category'] for number, data in rows}
+        sub_categories = {}
+        for pk, slug in SubCategory.objects.filter(slug__in=refs).values_list('id', 'slug'):
+            sub_categories[slug] = pk
+        ids = {int(ref) for ref in refs if ref.isdigit()}
+        for pk in SubCategory.objects.filter(id__in=ids).values_list('id', flat=True):
+            sub_categories[str(pk)] = pk
+
+        resolved, seen_slugs = [], set()
+        for number, data in rows:
+            if data['sub_category'] not in sub_categories:
+                self.reject(number, {'sub_category': [f"Unknown sub category {data['sub_category']!r}."]})
+            elif data.get('slug') and data['slug'] in seen_slugs:
+                self.reject(number, {'slug': ['Duplicate slug in the same batch.']})
+            else:
+                seen_slugs.add(data.get('slug'))
+                resolved.append(dict(data, sub_category_id=sub_categories[data['sub_category']]))
+        return resolved
+
+    def import_batch(self, batch):
+        rows = self.resolve_sub_categories(self.validate(batch))
+        if not rows:
+            return
+        given = [data['slug'] for data in rows if data.get('slug')]
+        existing = {slug: (pk, sub_category_id) for slug, pk, sub_category_id in
+                    Product.objects.filter(slug__in=given).values_list('slug', 'id', 'sub_category_id')}
+        unnamed = [data for data in rows if not data.get('slug')]
+        for data, slug in zip(unnamed, unique_slugs(Product, [data['name'] for data in unnamed], taken=given)):
+            data['slug'] = slug
+
+        to_create, to_update = [], []
+        for data in rows:
+            product = Product(
+                name=data['name'], slug=data['slug'], price=data['price'], quantity=data['quantity'],
+                discount=data['discount'], description=data['description'], sub_category_id=data['sub_category_id'],
+            )
+            if data['slug'] in existing:
+                product.pk = existing[data['slug']][0]
+                to_update.append(product)
+            else:
+                to_create.append(product)
+
+        with transaction.atomic():
+            # INSERT ... ON CONFLICT (slug) DO UPDATE, so a product created concurrently is updated, not duplicated.
+            Product.objects.bulk_create(
+                to_create + to_update, batch_size=self.batch_size,
+                update_conflicts=True, unique_fields=['slug'], update_fields=UPDATE_FIELDS,
+            )
+            if any(product.pk is None for product in to_create):
+                ids = dict(Product.objects.filter(slug__in=[product.slug for product in to_create])
+                           .values_list('slug', 'id'))
+                for product in to_create:
+                    product.pk = ids[product.slug]
+            self.link_attributes(rows, {product.slug: product.pk for product in to_create + to_update})
+
+        product_ids = [product.pk for product in to_create + to_update]
+        get_search_backend().index(product_ids)
+        rebuild_facet_counts({data['sub_category_id'] for data in rows}
+                             | {sub_category_id for pk, sub_category_id in existing.values()})
+        invalidate_product_detail(*[product.pk for product in to_update])
+        bump_model_version(Product, ProductAttribute)
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def link_attributes(self, rows, product_ids):
+        rows = [data for data in rows if 'attributes' in data]
+        if not rows:
+            return
+        attribute_ids = attribute_names.get_or_create({name for data in rows for name in data['attributes']})
+        value_ids = attribute_values.get_or_create({value for data in rows for value in data['attributes'].values()})
+        wanted = {
+            (product_ids[data['slug']], attribute_ids[name], value_ids[value])
+            for data in rows for name, value in data['attributes'].items()
+        }
+        current = {
+            (product_id, attribute_id, value_id): pk
+            for pk, product_id, attribute_id, value_id in ProductAttribute.objects.filter(
+                product_id__in=[product_ids[data['slug']] for data in rows]
+            ).values_list('id', 'product_id', 'attribute_id', 'attribute_value_id')
+        }
+        # Only links that changed are touched; a re-import of unchanged attributes writes nothing here.
+        # Stale links go with plain DELETEs: their per-row signal handlers would redo the facet rebuild,
+        # reindex and cache invalidation that import_batch runs once for the whole batch.
+        stale = [pk for link, pk in current.items() if link not in wanted]
+        with connection.cursor() as cursor:
+            for start in range(0, len(stale), DELETE_CHUNK):
+                chunk = stale[start:start + DELETE_CHUNK]
+                cursor.execute(f"DELETE FROM {ProductAttribute._meta.db_table} WHERE id IN "
+                               f"({', '.join(['%s'] * len(chunk))})", chunk)
+        ProductAttribute.objects.bulk_create([
+            ProductAttribute(product_id=product_id, attribute_id=attribute_id, attribute_value_id=value_id)
+            for product_id, attribute_id, value_id in wanted - current.keys()
+        ], batch_size=self.batch_size)
+
+
+class RowsParser(BaseParser):
+    """Hands the view a lazy ``(line number, row)`` iterator over the request body instead of parsed data."""
+    import_format = None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        lines = codecs.iterdecode(stream or [], encoding)
+        return read_rows(lines, self.import_format)
+
+
+class CSVRowsParser(RowsParser):
+    media_type = 'text/csv'
+    import_format = 'csv'
+
+
+class NDJSONRowsParser(RowsParser):
+    media_type = 'application/x-ndjson'
+    import_format = 'ndjson'
@@ -0,0 +1,56 @@
+import asyncio
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+
+from olcha.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Load-test the sync DRF catalog endpoints against their async counterparts through the ASGI handler.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    async def load(self, url, total, concurrency):
+        client = AsyncClient()
+        gate = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one():
+            async with gate:
+                start = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError(f'{url} answered {response.status_code}')
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        return total / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+    async def run(self, options):
+        product = await sync_to_async(Product.objects.order_by('id').first)()
+        if product is None:
+            raise CommandError('The catalog is empty; add a product first.')
+        pairs = (
+            ('categories', '/Olcha/categories/', '/Olcha/async/categories/'),
+            ('products', '/Olcha/products/', '/Olcha/async/products/'),
+            ('product detail', f'/Olcha/products-detail/{product.pk}/', f'/Olcha/async/products/{product.pk}/'),
+        )
+        self.stdout.write(f"{options['requests']} requests, {options['concurrency']} concurrent")
+        for name, sync_url, async_url in pairs:
+            for kind, url in (('sync', sync_url), ('async', async_url)):
+                rate, p50, p95 = await self.load(url, options['requests'], options['concurrency'])
+                self.stdout.write(
+                    f'{name:15} {kind:5} {rate:8.0f} req/s   p50 {p50 * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms'
+                )
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import Command as CreateCacheTable
+from django.db import connection
+
+BENCH_TABLE = 'olcha_bench_cache'
+
+
+class Command(BaseCommand):
+    help = 'Compare the configured cache tiers with the DatabaseCache they replaced on a read-heavy workload.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=20000)
+        parser.add_argument('--keys', type=int, default=500)
+        parser.add_argument('--payload', type=int, default=4096, help='Bytes per cached value.')
+        parser.add_argument('--write-ratio', type=float, default=0.1)
+
+    def run(self, cache, options):
+        rng = random.Random(0)
+        payload = b'x' * options['payload']
+        keys = [f'bench:{n}' for n in range(options['keys'])]
+        weights = [1 / (rank + 1) for rank in range(len(keys))]  # Zipf-like: a few hot pages dominate.
+        for key in keys:
+            cache.set(key, payload, 300)
+        timings = {'get': [0.0, 0], 'set': [0.0, 0]}
+        for key in rng.choices(keys, weights, k=options['operations']):
+            operation = 'set' if rng.random() < options['write_ratio'] else 'get'
+            start = time.perf_counter()
+            if operation == 'set':
+                cache.set(key, payload, 300)
+            else:
+                cache.get(key)
+            timings[operation][0] += time.perf_counter() - start
+            timings[operation][1] += 1
+        for key in keys:
+            cache.delete(key)
+        return ' '.join(
+            f'{operation} {count / elapsed if elapsed else 0:10.0f}/s' for operation, (elapsed, count) in timings.items()
+        )
+
+    def handle(self, *args, **options):
+        create = CreateCacheTable()
+        create.verbosity = 0
+        create.create_table(connection.alias, BENCH_TABLE, False)
+        try:
+            database = DatabaseCache(BENCH_TABLE, {})
+            self.stdout.write(f'DatabaseCache        {self.run(database, options)}')
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {connection.ops.quote_name(BENCH_TABLE)}')
+
+        self.stdout.write(f'shared tier only     {self.run(caches["shared"], options)}')
+        default = caches['default']
+        if hasattr(default, 'reset_stats'):
+            default.reset_stats()
+        self.stdout.write(f'default (tiered)     {self.run(default, options)}')
+        if hasattr(default, 'stats'):
+            self.stdout.write(f'tier stats: {default.stats()}')
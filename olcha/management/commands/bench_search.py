@@ -0,0 +1,72 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from olcha.models import Category, SubCategory, Product
+from olcha.search import get_search_backend, ProductSearchFilter
+
+BRANDS = ('samsung', 'apple', 'xiaomi', 'lenovo', 'asus', 'huawei', 'philips', 'bosch', 'sony', 'canon')
+SYLLABLES = ('ka', 'lo', 'mi', 'ra', 'te', 'su', 'no', 'vi', 'de', 'po', 'xa', 'zu', 'be', 'qi', 'ho', 'ne')
+
+
+def seed_catalog(size):
+    rng = random.Random(0)
+    vocabulary = [''.join(rng.choices(SYLLABLES, k=3)) for _ in range(5000)]
+    category = Category.objects.bulk_create([Category(name='bench', image='images/bench.png', slug='bench-category')])[0]
+    sub_category = SubCategory.objects.bulk_create(
+        [SubCategory(name='bench', image='images/bench.png', slug='bench-sub-category', category=category)]
+    )[0]
+    Product.objects.bulk_create([
+        Product(name=' '.join([rng.choice(BRANDS)] + rng.sample(vocabulary, 2)),
+                description=' '.join(rng.choices(vocabulary, k=30)),
+                price=rng.randint(1, 1000), quantity=10, discount=0, slug=f'bench-product-{n}',
+                sub_category=sub_category)
+        for n in range(size)
+    ], batch_size=1000)
+    get_search_backend().rebuild()
+
+
+class Command(BaseCommand):
+    help = 'Compare the FTS search backend with the icontains SearchFilter it replaced.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=['sony', 'sams', 'kalomi', 'apple kalo'])
+        parser.add_argument('--products', type=int, default=0,
+                            help='Seed this many synthetic products in a rolled-back transaction first.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def timed(self, search, query, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            hits = search(query)
+        return (time.perf_counter() - start) / repeat * 1000, len(hits)
+
+    def icontains(self, query):
+        # What SearchFilter built from the old search_fields = ('name', 'rating', 'price', 'id').
+        products = Product.objects.all()
+        for term in query.split():
+            condition = Q()
+            for field in ('name', 'rating', 'price', 'id'):
+                condition |= Q(**{f'{field}__icontains': term})
+            products = products.filter(condition)
+        return list(products.values_list('id', flat=True)[:ProductSearchFilter.max_results])
+
+    def indexed(self, query):
+        return get_search_backend().search(query, ProductSearchFilter.max_results)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['products']:
+                seed_catalog(options['products'])
+            self.stdout.write(f'{Product.objects.count()} products, {options["repeat"]} runs per query')
+            for query in options['queries']:
+                old_ms, old_hits = self.timed(self.icontains, query, options['repeat'])
+                new_ms, new_hits = self.timed(self.indexed, query, options['repeat'])
+                self.stdout.write(
+                    f'{query!r:20} SearchFilter {old_ms:8.2f} ms ({old_hits} hits)   '
+                    f'FTS {new_ms:8.2f} ms ({new_hits} hits)'
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from rest_framework.renderers import JSONRenderer
+
+from olcha.compact import CompactJSONRenderer
+from olcha.management.commands.bench_search import seed_catalog
+from olcha.models import Category, Product, Comment
+from olcha.serializer import CategorySerializer, ProductSerializer, CommentSerializer, CategoryCompactSerializer, \
+    ProductCompactSerializer, CommentCompactSerializer
+
+
+class Command(BaseCommand):
+    help = 'Per-row cost of ModelSerializer + JSONRenderer against the .values() compact path on list pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--products', type=int, default=0,
+                            help='Seed this many synthetic products in a rolled-back transaction first.')
+
+    def timed(self, build, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            body = build()
+        return (time.perf_counter() - start) / repeat, body
+
+    def compare(self, name, queryset, serializer_class, compact_class, rows, repeat):
+        queryset = queryset.order_by('id')[:rows]
+        count = len(queryset)
+        if not count:
+            self.stdout.write(f'{name:10} no rows')
+            return
+        regular, regular_body = self.timed(
+            lambda: JSONRenderer().render(serializer_class(queryset.all(), many=True).data), repeat
+        )
+        compact_serializer = compact_class()
+        compact, compact_body = self.timed(
+            lambda: CompactJSONRenderer().render(compact_serializer.represent(compact_serializer.values(queryset.all()))),
+            repeat,
+        )
+        if regular_body != compact_body:
+            raise CommandError(f'{name}: compact output differs from {serializer_class.__name__}.')
+        self.stdout.write(
+            f'{name:10} {count:6} rows   serializer {regular / count * 1e6:7.1f} us/row   '
+            f'compact {compact / count * 1e6:7.1f} us/row   {regular / compact:5.1f}x'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['products']:
+                seed_catalog(options['products'])
+            rows, repeat = options['rows'], options['repeat']
+            self.compare('categories', Category.objects.annotate(subcategories_count=Count('sub_categories')),
+                         CategorySerializer, CategoryCompactSerializer, rows, repeat)
+            self.compare('products', Product.objects.all(), ProductSerializer, ProductCompactSerializer, rows, repeat)
+            self.compare('comments', Comment.objects.select_related('user'), CommentSerializer,
+                         CommentCompactSerializer, rows, repeat)
+            transaction.set_rollback(True)
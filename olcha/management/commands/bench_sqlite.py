@@ -0,0 +1,122 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from olcha.sqlite import apply_pragmas
+
+PROFILES = {
+    # What Django opens by default: rollback journal, deferred transactions, 5s busy wait.
+    'default': {'pragmas': {}, 'begin': 'BEGIN', 'timeout': 5},
+    'tuned': {'pragmas': None, 'begin': 'BEGIN IMMEDIATE', 'timeout': 5},
+}
+
+
+class Command(BaseCommand):
+    help = 'Write concurrency of the default SQLite setup against the production profile, on a copy of the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=PROFILES, action='append',
+                            help='Profile to run (repeatable); both by default.')
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('bench_sqlite only runs against an SQLite database.')
+        source = settings.DATABASES['default']['NAME']
+        for name in options['profile'] or list(PROFILES):
+            profile = dict(PROFILES[name])
+            if profile['pragmas'] is None:
+                profile['pragmas'] = settings.OLCHA_SQLITE_PRAGMAS
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                shutil.copyfile(source, path)
+                result = self.run_profile(path, profile, options)
+            self.stdout.write(
+                f'{name:8} writes {result["writes"] / options["seconds"]:8.0f}/s   '
+                f'reads {result["reads"] / options["seconds"]:8.0f}/s   '
+                f'write p95 {result["p95"] * 1000:7.2f} ms   locked {result["locked"]}'
+            )
+
+    def connect(self, path, profile):
+        db = sqlite3.connect(path, timeout=profile['timeout'], isolation_level=None, check_same_thread=False)
+        apply_pragmas(db.cursor(), profile['pragmas'])
+        return db
+
+    def run_profile(self, path, profile, options):
+        setup = self.connect(path, profile)
+        ids = [row[0] for row in setup.execute('SELECT id FROM olcha_product')]
+        setup.execute('UPDATE olcha_product SET quantity = 1000000')
+        setup.close()
+        if not ids:
+            raise CommandError('The database has no products to write to.')
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        result = {'writes': 0, 'reads': 0, 'locked': 0, 'latencies': []}
+
+        def count(key, value=1):
+            with lock:
+                result[key] += value
+
+        def writer():
+            db = self.connect(path, profile)
+            latencies = []
+            while not stop.is_set():
+                # Checkout shape: read the stock, then decrement it in the same transaction.
+                product_id = random.choice(ids)
+                start = time.perf_counter()
+                try:
+                    db.execute(profile['begin'])
+                    db.execute('SELECT quantity FROM olcha_product WHERE id = ?', [product_id]).fetchone()
+                    db.execute('UPDATE olcha_product SET quantity = quantity - 1 WHERE id = ? AND quantity > 0',
+                               [product_id])
+                    db.execute('COMMIT')
+                except sqlite3.OperationalError as exc:
+                    if db.in_transaction:
+                        db.execute('ROLLBACK')
+                    if 'locked' not in str(exc):
+                        raise
+                    count('locked')
+                    continue
+                latencies.append(time.perf_counter() - start)
+            db.close()
+            count('writes', len(latencies))
+            with lock:
+                result['latencies'].extend(latencies)
+
+        def reader():
+            db = self.connect(path, profile)
+            reads = 0
+            while not stop.is_set():
+                try:
+                    db.execute('SELECT id, name, price FROM olcha_product ORDER BY created_at DESC LIMIT 20').fetchall()
+                    reads += 1
+                except sqlite3.OperationalError as exc:
+                    if 'locked' not in str(exc):
+                        raise
+                    count('locked')
+            db.close()
+            count('reads', reads)
+
+        threads = [threading.Thread(target=writer) for _ in range(options['writers'])]
+        threads += [threading.Thread(target=reader) for _ in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies = sorted(result.pop('latencies'))
+        result['p95'] = latencies[int(len(latencies) * 0.95)] if latencies else 0
+        return result
@@ -0,0 +1,42 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from olcha.export import EXPORT_FORMATS, CHUNK_SIZE, export_catalog, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Stream the product catalog as NDJSON or JSON to a file or stdout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='Target file, "-" for stdout.')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--since', help='Only products written or deleted at or after this ISO 8601 datetime.')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output (implied by a .gz target).')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options['since'])
+        except ValueError as error:
+            raise CommandError(error)
+        target = options['output']
+        compress = options['gzip'] or target.endswith('.gz')
+
+        started_at = timezone.now()
+        start = time.perf_counter()
+        written = 0
+        stream = sys.stdout.buffer if target == '-' else open(target, 'wb')
+        try:
+            for chunk in export_catalog(options['format'], since, compress, options['chunk_size']):
+                stream.write(chunk)
+                written += len(chunk)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+        self.stderr.write(
+            f'Wrote {written} bytes in {time.perf_counter() - start:.2f}s; '
+            f'next delta: --since {started_at.isoformat()}'
+        )
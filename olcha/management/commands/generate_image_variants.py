@@ -0,0 +1,39 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from olcha.images import render_variants
+from olcha.models import Category, SubCategory, Image
+
+
+class Command(BaseCommand):
+    help = 'Render the missing WebP/JPEG variants of every category, sub-category and product image.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render variants that already exist.')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (Category, SubCategory, Image):
+            names.update(model.objects.exclude(image='').values_list('image', flat=True))
+
+        def render(name):
+            try:
+                return name, render_variants(name, force=options['force']), None
+            except Exception as error:
+                return name, 0, error
+
+        start = time.perf_counter()
+        written = failed = 0
+        with ThreadPoolExecutor(options['workers']) as executor:
+            for name, count, error in executor.map(render, sorted(names)):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                written += count
+        self.stdout.write(
+            f'{len(names)} images, {written} variants written, {failed} failed '
+            f'in {time.perf_counter() - start:.2f}s.'
+        )
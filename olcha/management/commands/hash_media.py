@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from olcha.media import HASHED_NAME
+from olcha.models import Category, SubCategory, Image
+
+
+class Command(BaseCommand):
+    help = 'Move images uploaded under their original names into content-addressed storage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help='Delete the original file once no row refers to it any more.')
+
+    def handle(self, *args, **options):
+        moved = missing = 0
+        originals = set()
+        for model in (Category, SubCategory, Image):
+            for instance in model.objects.exclude(image='').iterator():
+                name = instance.image.name
+                if HASHED_NAME.match(name):
+                    continue
+                storage = instance.image.storage
+                if not storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f'{model.__name__} {instance.pk}: {name} is missing')
+                    continue
+                with storage.open(name) as file:
+                    instance.image.name = storage.save(name, file)
+                # save() so the usual signals re-render variants and drop cached documents.
+                instance.save(update_fields=['image', 'updated_at'])
+                originals.add((storage, name))
+                moved += 1
+
+        deleted = 0
+        if options['delete']:
+            for storage, name in originals:
+                if not any(model.objects.filter(image=name).exists() for model in (Category, SubCategory, Image)):
+                    storage.delete(name)
+                    deleted += 1
+        self.stdout.write(f'{moved} images moved, {missing} missing, {deleted} originals deleted.')
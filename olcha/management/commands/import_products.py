@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from olcha.importer import BATCH_SIZE, IMPORT_FORMATS, ProductImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk upsert products from a CSV or NDJSON file, matching existing products on slug.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='Defaults to the file extension (.csv, anything else is NDJSON).')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        try:
+            lines = open(path, encoding='utf-8-sig', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with lines:
+            report = ProductImporter(options['batch_size']).run(read_rows(lines, import_format))
+
+        for error in report['errors']:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows']} rows in {report['seconds']}s ({report['rows_per_second']} rows/s): "
+            f"{report['created']} created, {report['updated']} updated, {report['failed']} failed."
+        ))
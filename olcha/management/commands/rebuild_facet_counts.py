@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from olcha.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed attribute facet counts from ProductAttribute.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sub_category_ids', nargs='*', type=int, help='Limit the rebuild to these sub categories.')
+
+    def handle(self, *args, **options):
+        created = rebuild_facet_counts(options['sub_category_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {created} facet counts.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from olcha.ratings import rebuild_product_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.rating_sum, rating_count and rating from the comments table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help='Limit the rebuild to these products.')
+
+    def handle(self, *args, **options):
+        updated = rebuild_product_ratings(options['product_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings for {updated} products.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from olcha.models import Product
+from olcha.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from the catalog tables.'
+
+    def handle(self, *args, **options):
+        get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {Product.objects.count()} products.'))
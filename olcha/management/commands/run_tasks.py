@@ -0,0 +1,24 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from olcha.tasks import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks; the dedicated worker for processes started with TASK_WORKER=0.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run what is due and exit.')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            completed = run_pending(options['batch_size'])
+            if options['once']:
+                self.stdout.write(f'{completed} tasks completed.')
+                return
+            close_old_connections()
+            time.sleep(settings.OLCHA_TASK_POLL)
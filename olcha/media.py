@@ -0,0 +1,106 @@
+"""
+Content-addressed uploads and the media file view.
+
+Image fields store their files through ``STORAGES['media']``
+(ContentAddressedStorage). A file is named by the SHA-256 of its bytes
+(``content/ab/cd/<sha256>.jpg``), so the same photo uploaded for ten
+products is written once, and a stored name never changes meaning.
+Resized variants (olcha.images) are the exception: their name is derived
+from the original's, so they are stored under ``variants/`` as given.
+
+``serve_media`` serves MEDIA_URL. Content-addressed originals get a
+far-future ``immutable`` Cache-Control; the hash is their ETag. Other
+files are revalidated by mtime/size: uploads from before this storage, and
+resized variants, which keep their name when they are re-rendered. With ``OLCHA_MEDIA_SENDFILE`` set, the web server sends the
+bytes (X-Sendfile for Apache/lighttpd, X-Accel-Redirect for nginx) and the
+Python worker only returns headers.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage, storages
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+VARIANTS_PREFIX = 'variants/'
+HASHED_NAME = re.compile(r'^content/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names every saved file after the SHA-256 of its content."""
+
+    def hashed_name(self, name, digest):
+        extension = os.path.splitext(name)[1].lower()
+        return f'content/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    def _save(self, name, content):
+        if name.startswith(VARIANTS_PREFIX):
+            return super()._save(name, content)
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        hashed = self.hashed_name(name, sha256.hexdigest())
+        if self.exists(hashed):
+            return hashed
+        # Write under a temporary name and rename, so the hashed name never points at a partial file.
+        partial = super()._save(f'{hashed}.partial', content)
+        os.replace(self.path(partial), self.path(hashed))
+        return hashed
+
+
+def media_storage():
+    return storages['media']
+
+
+def file_etag(name, stat):
+    match = HASHED_NAME.match(name)
+    if match:
+        return quote_etag(match['digest'])
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def set_headers(response, headers):
+    for header, value in headers.items():
+        response.headers[header] = value
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('File not found.')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found.')
+
+    headers = {
+        'ETag': file_etag(path, stat),
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE if HASHED_NAME.match(path) else REVALIDATE,
+    }
+    not_modified = get_conditional_response(request, etag=headers['ETag'], last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return set_headers(not_modified, headers)
+
+    mode = settings.OLCHA_MEDIA_SENDFILE
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response.headers['X-Sendfile'] = full_path
+    elif mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = settings.OLCHA_MEDIA_ACCEL_PREFIX + quote(path)
+    else:
+        response = FileResponse(open(full_path, 'rb'))
+    return set_headers(response, headers)
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:37
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('olcha', 'Product')
+    Comment = apps.get_model('olcha', 'Comment')
+    comments = Comment.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_sum=Coalesce(Subquery(comments.annotate(total=Sum('rating')).values('total')), 0),
+        rating_count=Coalesce(Subquery(comments.annotate(total=Count('id')).values('total')), 0),
+    )
+    # olcha.ratings.average_rating as of this migration: the rounded average, 1 for unreviewed products.
+    Product.objects.update(rating=Case(
+        When(GreaterThan(F('rating_count'), 0),
+             then=Cast(Round(Cast(F('rating_sum'), FloatField()) / F('rating_count')), IntegerField())),
+        default=Value(1),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0004_order_orderitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:05
+
+from django.db import migrations
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS olcha_product_fts "
+        "USING fts5(name, description, attributes, sub_category, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO olcha_product_fts (rowid, name, description, attributes, sub_category) "
+        "SELECT p.id, p.name, p.description, "
+        "COALESCE((SELECT group_concat(a.name || ' ' || v.value, ' ') FROM olcha_productattribute pa "
+        "JOIN olcha_attribute a ON a.id = pa.attribute_id "
+        "JOIN olcha_attributevalue v ON v.id = pa.attribute_value_id "
+        "WHERE pa.product_id = p.id), ''), s.name "
+        "FROM olcha_product p JOIN olcha_subcategory s ON s.id = p.sub_category_id"
+    )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS olcha_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0005_product_rating_sum_rating_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_facet_counts(apps, schema_editor):
+    ProductAttribute = apps.get_model('olcha', 'ProductAttribute')
+    FacetCount = apps.get_model('olcha', 'FacetCount')
+    rows = ProductAttribute.objects.values('product__sub_category_id', 'attribute_id', 'attribute_value_id').annotate(
+        total=Count('product', distinct=True)
+    ).order_by()
+    FacetCount.objects.bulk_create([
+        FacetCount(sub_category_id=row['product__sub_category_id'], attribute_id=row['attribute_id'],
+                   attribute_value_id=row['attribute_value_id'], product_count=row['total'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('attribute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='olcha.attribute')),
+                ('attribute_value', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='olcha.attributevalue')),
+                ('sub_category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='olcha.subcategory')),
+            ],
+            options={
+                'unique_together': {('sub_category', 'attribute', 'attribute_value')},
+            },
+        ),
+        migrations.RunPython(backfill_facet_counts, migrations.RunPython.noop),
+    ]
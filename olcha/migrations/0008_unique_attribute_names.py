@@ -0,0 +1,51 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:14
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Point every link at the oldest row of each name, drop the rest and recount the facets they split."""
+    ProductAttribute = apps.get_model('olcha', 'ProductAttribute')
+    FacetCount = apps.get_model('olcha', 'FacetCount')
+    merged = False
+    for model_name, field, link in (('Attribute', 'name', 'attribute'), ('AttributeValue', 'value', 'attribute_value')):
+        model = apps.get_model('olcha', model_name)
+        canonical = dict(model.objects.values(field).annotate(keep=Min('id')).values_list(field, 'keep'))
+        duplicates = model.objects.exclude(id__in=canonical.values())
+        for pk, name in duplicates.values_list('id', field):
+            ProductAttribute.objects.filter(**{f'{link}_id': pk}).update(**{f'{link}_id': canonical[name]})
+            merged = True
+        duplicates.delete()
+    if not merged:
+        return
+    FacetCount.objects.all().delete()
+    rows = ProductAttribute.objects.values('product__sub_category_id', 'attribute_id', 'attribute_value_id').annotate(
+        total=Count('product', distinct=True)
+    ).order_by()
+    FacetCount.objects.bulk_create([
+        FacetCount(sub_category_id=row['product__sub_category_id'], attribute_id=row['attribute_id'],
+                   attribute_value_id=row['attribute_value_id'], product_count=row['total'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0007_facetcount'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='attribute',
+            name='name',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='attributevalue',
+            name='value',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+    ]
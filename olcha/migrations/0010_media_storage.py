@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:32
+
+import olcha.media
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0009_catalog_and_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='image',
+            field=models.ImageField(storage=olcha.media.media_storage, upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image',
+            field=models.ImageField(storage=olcha.media.media_storage, upload_to='media/'),
+        ),
+        migrations.AlterField(
+            model_name='subcategory',
+            name='image',
+            field=models.ImageField(storage=olcha.media.media_storage, upload_to='images/'),
+        ),
+    ]
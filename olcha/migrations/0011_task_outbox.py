@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0010_media_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=50)),
+                ('key', models.CharField(max_length=50)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, null=True)),
+                ('claimed_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run_after', 'id'], name='task_run_after_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('claimed_until__isnull', True), ('run_after__isnull', False)), fields=('name', 'key'), name='task_waiting_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0011_task_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='claimed_by',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
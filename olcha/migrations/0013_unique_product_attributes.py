@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:53
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_links(apps, schema_editor):
+    """Keep the oldest link of each (attribute, value, product) and recount the facets the others inflated."""
+    ProductAttribute = apps.get_model('olcha', 'ProductAttribute')
+    FacetCount = apps.get_model('olcha', 'FacetCount')
+    keep = ProductAttribute.objects.values('attribute_id', 'attribute_value_id', 'product_id').annotate(
+        keep=Min('id')
+    ).order_by().values('keep')
+    deleted, _ = ProductAttribute.objects.exclude(id__in=keep).delete()
+    if not deleted:
+        return
+    FacetCount.objects.all().delete()
+    rows = ProductAttribute.objects.values('product__sub_category_id', 'attribute_id', 'attribute_value_id').annotate(
+        total=Count('product', distinct=True)
+    ).order_by()
+    FacetCount.objects.bulk_create([
+        FacetCount(sub_category_id=row['product__sub_category_id'], attribute_id=row['attribute_id'],
+                   attribute_value_id=row['attribute_value_id'], product_count=row['total'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0012_task_claimed_by'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_links, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='productattribute',
+            name='productattribute_facet_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='productattribute',
+            constraint=models.UniqueConstraint(fields=('attribute', 'attribute_value', 'product'), name='productattribute_unique'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0013_unique_product_attributes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product_id', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='tombstone_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,139 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from olcha.compact import CompactJSONRenderer
+
+
+class QueryBudgetMixin:
+    """
+    Lets a view declare the joins its serializer needs instead of
+    hand-writing them in every ``get_queryset``.
+
+    ``query_budget`` is the number of queries a list (or detail) request may
+    run regardless of page size; ``olcha.tests`` enforces it.
+    """
+    annotations = {}
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    query_budget = None
+
+    def get_queryset(self):
+        return self.optimize_queryset(super().get_queryset())
+
+    def optimize_queryset(self, queryset):
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        if self.select_related_fields:
+            queryset = queryset.select_related(*self.select_related_fields)
+        prefetch_related_fields = self.get_prefetch_related_fields()
+        if prefetch_related_fields:
+            queryset = queryset.prefetch_related(*prefetch_related_fields)
+        return queryset
+
+    def get_prefetch_related_fields(self):
+        return self.prefetch_related_fields
+
+
+class OwnerScopedMixin:
+    """Restricts a view to rows owned by the requesting user (``owner_field`` is the lookup to the user)."""
+    owner_field = 'user'
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**{f'{self.owner_field}__pk': self.request.user.pk})
+
+
+class CompactListMixin:
+    """
+    Opt-in fast path for ``list``: rows come from ``.values()`` and are shaped
+    by ``compact_serializer_class`` instead of instantiating a ModelSerializer
+    per object.
+
+    Only used when CompactJSONRenderer was negotiated, since other renderers
+    would encode the raw Decimals differently; the browsable API keeps the
+    regular serializer.
+    """
+    compact_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if self.compact_serializer_class is None or not isinstance(request.accepted_renderer, CompactJSONRenderer):
+            return super().list(request, *args, **kwargs)
+        serializer = self.compact_serializer_class(context=self.get_serializer_context())
+        queryset = self.filter_queryset(self.get_queryset())
+        # Cursor pagination reads its position from the row, so the ordering columns must be selected too.
+        get_ordering = getattr(self.paginator, 'get_ordering', None)
+        ordering = [field.lstrip('-') for field in get_ordering(request, queryset, self)] if get_ordering else []
+        rows = serializer.values(queryset, *ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.represent(page))
+        return Response(serializer.represent(rows))
+
+
+class SparseFieldsetMixin:
+    """
+    ``?fields=a,b`` / ``?exclude=c`` on reads: the serializer drops the other
+    fields (see SparseFieldsMixin) and the queryset stops loading them.
+
+    Unselected columns are left out with ``.only()`` and unselected nested
+    relations lose their prefetch, so a narrow listing reads and sends
+    only what it shows.
+    """
+    fields_param = 'fields'
+    exclude_param = 'exclude'
+
+    @cached_property
+    def readable_sources(self):
+        """``{field name: source}`` of every field the serializer can output."""
+        fields = self.get_serializer_class()().fields
+        return {name: field.source for name, field in fields.items() if not field.write_only}
+
+    @cached_property
+    def sparse_fields(self):
+        """Selected readable field names, or ``None`` when the request does not narrow the response."""
+        params = self.request.query_params
+        if self.request.method != 'GET' or not (params.get(self.fields_param) or params.get(self.exclude_param)):
+            return None
+        requested = {}
+        for param in (self.fields_param, self.exclude_param):
+            requested[param] = {name.strip() for name in params.get(param, '').split(',') if name.strip()}
+            unknown = requested[param] - self.readable_sources.keys()
+            if unknown:
+                raise ValidationError({param: f"Unknown fields: {', '.join(sorted(unknown))}. "
+                                              f"Choose from: {', '.join(self.readable_sources)}."})
+        return set(requested[self.fields_param] or self.readable_sources) - requested[self.exclude_param]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.sparse_fields is not None:
+            context['fields'] = self.sparse_fields
+        return context
+
+    def get_prefetch_related_fields(self):
+        prefetches = super().get_prefetch_related_fields()
+        if self.sparse_fields is None:
+            return prefetches
+        sources = {self.readable_sources[name] for name in self.sparse_fields}
+        return [lookup for lookup in prefetches
+                if (lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup).split('__')[0] in sources]
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.sparse_fields is None:
+            return queryset
+        columns = [self.readable_sources[name] for name in self.sparse_fields]
+        # Cursor pagination reads its ordering columns from each instance; deferring them would cost a query per row.
+        get_ordering = getattr(self.paginator, 'get_ordering', None)
+        if get_ordering and getattr(self, 'action', None) == 'list':
+            columns += [field.lstrip('-') for field in get_ordering(self.request, queryset, self)]
+        return queryset.only(*[name for name in columns if self.is_concrete_column(queryset.model, name)])
+
+    @staticmethod
+    def is_concrete_column(model, name):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        return field.concrete and not field.many_to_many
@@ -1,9 +1,14 @@
 from multiprocessing.managers import Value
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
 from django.utils.text import slugify
 
+from olcha.media import media_storage
+from olcha.slugs import unique_slugs
+
 
 # Create your models here.
 
@@ -17,7 +22,7 @@ class BaseModel(models.Model):
 
 class Category(BaseModel):
     name = models.CharField(max_length=50)
-    image = models.ImageField(upload_to='images/')
+    image = models.ImageField(upload_to='images/', storage=media_storage)
     slug = models.SlugField(max_length=50, unique=True)
 
     def __str__(self):
@@ -31,7 +36,7 @@ class Category(BaseModel):
 
 class SubCategory(BaseModel):
     name = models.CharField(max_length=50)
-    image = models.ImageField(upload_to='images/')
+    image = models.ImageField(upload_to='images/', storage=media_storage)
     slug = models.SlugField(max_length=50, unique=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='sub_categories')
 
@@ -46,26 +51,55 @@ class Product(BaseModel):
         FOUR = 4
         FIVE = 5
 
+    RATING_FIELDS = ('rating', 'rating_sum', 'rating_count')
+
     name = models.CharField(max_length=50)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.IntegerField()
     discount = models.FloatField()
     description = models.TextField()
     rating = models.IntegerField(choices=RatingChoices.choices, default=RatingChoices.ONE)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
     slug = models.SlugField(unique=True)
     sub_category = models.ForeignKey(SubCategory, on_delete=models.CASCADE, related_name='product')
 
+    class Meta:
+        indexes = [
+            # Cursor pagination order, over the whole catalog and within a sub category.
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['sub_category', '-created_at', '-id'], name='product_subcat_created_idx'),
+            # ?ordering=price / rating and updated_at delta exports.
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['rating', 'id'], name='product_rating_idx'),
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'sub_category_id' in field_names:
+            instance._sub_category_snapshot = instance.sub_category_id
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.slug:
-            self.slug = slugify(self.name)
-            super(Product, self).save(*args, **kwargs)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # The rating columns are maintained by olcha.ratings; a stale instance must not overwrite them.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.RATING_FIELDS
+            ]
+        # The slug is the import's upsert key, so once set it stays put; only a missing one is generated.
+        if not self.slug:
+            self.slug = unique_slugs(Product, [self.name])[0]
+        super(Product, self).save(*args, **kwargs)
 
 
 class Image(BaseModel):
-    image = models.ImageField(upload_to='media/')
+    image = models.ImageField(upload_to='media/', storage=media_storage)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='image')
 
 
@@ -83,18 +117,33 @@ class Comment(BaseModel):
     comment = models.TextField()
     rating = models.IntegerField(choices=RatingChoices.choices, default=RatingChoices.ONE)
 
+    class Meta:
+        indexes = [
+            # The comment feed, and a product's comments newest first.
+            models.Index(fields=['-created_at', '-id'], name='comment_created_idx'),
+            models.Index(fields=['product', '-created_at', '-id'], name='comment_product_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user} => {self.product} => {self.comment}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the product aggregate currently counts, so signals can apply an exact delta.
+        if {'product_id', 'rating'} <= set(field_names):
+            instance._rating_snapshot = (instance.product_id, instance.rating)
+        return instance
+
 
 class Attribute(BaseModel):
-    name = models.CharField(max_length=50)
+    name = models.CharField(max_length=50, unique=True)
 
     def __str__(self):
         return self.name
 
 class AttributeValue(BaseModel):
-    value = models.CharField(max_length=50)
+    value = models.CharField(max_length=50, unique=True)
 
     def __str__(self):
         return self.value
@@ -104,9 +153,52 @@ class ProductAttribute(BaseModel):
     attribute_value = models.ForeignKey(AttributeValue, on_delete=models.CASCADE, related_name='product_attribute')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product_attribute')
 
+    class Meta:
+        constraints = [
+            # One link per (attribute, value, product), so FacetCount deltas count products, not links. The
+            # unique index also covers the facet filter subquery (attribute, value -> product).
+            models.UniqueConstraint(fields=['attribute', 'attribute_value', 'product'],
+                                    name='productattribute_unique'),
+        ]
+
     def __str__(self):
         return f"{self.attribute} => {self.attribute_value} => {self.product}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The pair this row contributes to FacetCount, so signals can move it when the row changes.
+        if {'attribute_id', 'attribute_value_id', 'product_id'} <= set(field_names):
+            instance._facet_snapshot = (instance.product_id, instance.attribute_id, instance.attribute_value_id)
+        return instance
+
+
+class FacetCount(BaseModel):
+    """Precomputed number of products per (sub category, attribute, value), maintained by olcha.facets."""
+    sub_category = models.ForeignKey(SubCategory, on_delete=models.CASCADE, related_name='facet_counts')
+    attribute = models.ForeignKey(Attribute, on_delete=models.CASCADE, related_name='facet_counts')
+    attribute_value = models.ForeignKey(AttributeValue, on_delete=models.CASCADE, related_name='facet_counts')
+    product_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('sub_category', 'attribute', 'attribute_value')
+
+    def __str__(self):
+        return f"{self.sub_category} => {self.attribute} => {self.attribute_value} ({self.product_count})"
+
+
+
+class ProductTombstone(BaseModel):
+    """Id of a deleted product, so delta exports can tell consumers to drop it; see olcha.export."""
+    product_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='tombstone_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} deleted at {self.created_at}"
 
 
 class Order(BaseModel):
@@ -116,6 +208,13 @@ class Order(BaseModel):
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=50,choices=[('panding', 'Panding'), ('complected', 'complected')], default='pending')
 
+    class Meta:
+        indexes = [
+            # A user's orders newest first (the order endpoints), and by state for fulfilment.
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['user', 'status', 'is_paid'], name='order_user_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user} => {self.is_paid} => {self.address} => {self.created_at}"
 
@@ -127,16 +226,45 @@ class OrderItem(BaseModel):
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
     def save(self, *args, **kwargs):
-        if self.product.quantity >= self.quantity:
-            self.product.quantity -= self.quantity
-            self.product.save()
-        else:
-            raise ValueError('Not enough stock for this product')
+        from olcha.stock import reserve_stock, release_stock
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self._state.adding:
+                previous = OrderItem.objects.filter(pk=self.pk).values_list('product_id', 'quantity').first()
+                if previous:
+                    release_stock(*previous)
+            reserve_stock(self.product_id, self.quantity)
+            super().save(*args, **kwargs)
 
     def get_total(self):
         return self.quantity * self.price
 
     def __str__(self):
-        return f"{self.order} => {self.product}"
\ No newline at end of file
+        return f"{self.order} => {self.product}"
+
+class Task(BaseModel):
+    """Outbox row for olcha.tasks: side-effect work queued by a write, run after it commits."""
+    name = models.CharField(max_length=50)
+    key = models.CharField(max_length=50)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # NULL once the task has used up its attempts; kept with last_error for OLCHA_TASK_RETENTION seconds.
+    run_after = models.DateTimeField(null=True, default=timezone.now)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    # Set by the UPDATE that claims the row, so a worker reads back exactly the rows it won.
+    claimed_by = models.UUIDField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            # Repeated work for the same key coalesces into one waiting row.
+            models.UniqueConstraint(
+                fields=['name', 'key'], condition=Q(claimed_until__isnull=True, run_after__isnull=False),
+                name='task_waiting_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['run_after', 'id'], name='task_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} => {self.key} ({self.attempts})"
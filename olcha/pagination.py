@@ -0,0 +1,29 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.settings import api_settings
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the high-volume listings.
+
+    Pages seek on ``created_at`` (``id`` breaks ties) instead of using an
+    OFFSET, so page 10,000 costs the same as page 1. When ``?ordering=`` is
+    given, OrderingFilter's field becomes the key instead; a ``?search=``
+    without an explicit ordering pages through the ranked matches, and the
+    response carries ``search_truncated`` (see ProductSearchFilter).
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if 'search_rank' in queryset.query.annotations and api_settings.ORDERING_PARAM not in request.query_params:
+            return ('search_rank',)
+        return super().get_ordering(request, queryset, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if hasattr(self.request, 'search_truncated'):
+            response.data['search_truncated'] = self.request.search_truncated
+        return response
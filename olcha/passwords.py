@@ -0,0 +1,121 @@
+"""
+Password hashing off the request workers.
+
+PBKDF2 is deliberately slow; run inline, a burst of logins pins every
+request worker and catalog reads queue behind them. Here hashing and
+verification run in a small process pool (``OLCHA_PASSWORD_WORKERS``) and
+at most ``OLCHA_PASSWORD_QUEUE`` jobs may be waiting or running; past that
+callers get PasswordQueueFull straight away and the view answers 429.
+
+A successful login is remembered for ``OLCHA_LOGIN_CACHE_TTL`` seconds as
+an HMAC of the user's stored hash and the password, so the same client
+logging in again skips PBKDF2. The stored hash is part of the key, so a
+password change invalidates it.
+"""
+import hashlib
+import hmac
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+
+class PasswordQueueFull(Exception):
+    pass
+
+
+def hash_in_worker(password):
+    return make_password(password)
+
+
+def verify_in_worker(password, encoded):
+    """``(valid, rehashed)``; ``rehashed`` is set when the stored hash uses outdated parameters."""
+    rehashed = []
+    valid = check_password(password, encoded, setter=lambda raw: rehashed.append(make_password(raw)))
+    return valid, rehashed[0] if rehashed else None
+
+
+class HashingPool:
+    def __init__(self):
+        self.executor = None
+        self.slots = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                # spawn: forking a threaded server process is unsafe; workers only need settings, not the app registry.
+                self.executor = ProcessPoolExecutor(settings.OLCHA_PASSWORD_WORKERS,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+                self.slots = threading.BoundedSemaphore(settings.OLCHA_PASSWORD_QUEUE)
+        return self.executor
+
+    def run(self, function, *args):
+        executor = self.start()
+        if not self.slots.acquire(blocking=False):
+            raise PasswordQueueFull()
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=settings.OLCHA_PASSWORD_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordQueueFull()
+
+
+pool = HashingPool()
+
+
+class RecentLogins:
+    max_entries = 10_000
+
+    def __init__(self):
+        self.expiry = {}
+        self.lock = threading.Lock()
+
+    def key(self, user, password):
+        message = f'{user.pk}:{user.password}:{password}'.encode()
+        return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).digest()
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.expiry.get(key, 0) > time.monotonic()
+
+    def add(self, key):
+        with self.lock:
+            if len(self.expiry) >= self.max_entries:
+                self.expiry.clear()
+            self.expiry[key] = time.monotonic() + settings.OLCHA_LOGIN_CACHE_TTL
+
+    def clear(self):
+        with self.lock:
+            self.expiry.clear()
+
+
+recent_logins = RecentLogins()
+
+
+def hash_password(password):
+    return pool.run(hash_in_worker, password)
+
+
+def verify_password(user, password):
+    """Check ``password`` against ``user``'s stored hash, upgrading the hash if its parameters are outdated."""
+    key = recent_logins.key(user, password)
+    if key in recent_logins:
+        return True
+    valid, rehashed = pool.run(verify_in_worker, password, user.password)
+    if rehashed:
+        type(user).objects.filter(pk=user.pk).update(password=rehashed)
+        user.password = rehashed
+        key = recent_logins.key(user, password)
+    if valid:
+        recent_logins.add(key)
+    return valid
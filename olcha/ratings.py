@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models import F, Sum, Count, Case, When, Value, OuterRef, Subquery, IntegerField, FloatField
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
+from django.utils.timezone import now
+
+from olcha.cache import invalidate_product_detail, bump_model_version
+from olcha.models import Product, Comment
+
+
+def average_rating(rating_sum, rating_count):
+    """SQL expression for the rounded average, falling back to the model default for unreviewed products."""
+    return Case(
+        When(GreaterThan(rating_count, 0),
+             then=Cast(Round(Cast(rating_sum, FloatField()) / rating_count), IntegerField())),
+        default=Value(Product.RatingChoices.ONE),
+    )
+
+
+def adjust_product_rating(product_id, sum_delta, count_delta):
+    """Apply a review delta with a single UPDATE; the row is never read into Python."""
+    rating_sum = F('rating_sum') + sum_delta
+    rating_count = F('rating_count') + count_delta
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=average_rating(rating_sum, rating_count),
+        updated_at=now(),
+    )
+    invalidate_product_detail(product_id)
+    bump_model_version(Product)
+
+
+def rebuild_product_ratings(product_ids=None):
+    """Recompute the aggregates from the comments table in two set-based UPDATEs."""
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    comments = Comment.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    with transaction.atomic():
+        updated = products.update(
+            rating_sum=Coalesce(Subquery(comments.annotate(total=Sum('rating')).values('total')), 0),
+            rating_count=Coalesce(Subquery(comments.annotate(total=Count('id')).values('total')), 0),
+            updated_at=now(),
+        )
+        products.update(rating=average_rating(F('rating_sum'), F('rating_count')))
+    invalidate_product_detail(*products.values_list('pk', flat=True))
+    bump_model_version(Product)
+    return updated
@@ -0,0 +1,157 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend
+
+from olcha.cache import bump_model_version
+from olcha.models import Product, ProductAttribute, Attribute, AttributeValue, SubCategory
+
+FTS_TABLE = 'olcha_product_fts'
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+class BaseSearchBackend:
+    """Keeps a product index in sync and answers ranked queries with a list of product ids."""
+
+    def index(self, product_ids):
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def search(self, query, limit):
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Unindexed fallback for databases without a full-text engine."""
+
+    def index(self, product_ids):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, limit):
+        products = Product.objects.all()
+        for term in tokenize(query):
+            products = products.filter(
+                Q(name__icontains=term) | Q(description__icontains=term) | Q(sub_category__name__icontains=term)
+                | Q(product_attribute__attribute_value__value__icontains=term)
+            )
+        return list(products.order_by('id').values_list('id', flat=True).distinct()[:limit])
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    FTS5 index with one row per product (``rowid`` is the product id).
+
+    Documents are assembled in SQL straight from the catalog tables, so
+    re-indexing a batch of products is two statements.
+    """
+    # bm25 column weights: name, description, attributes, sub_category.
+    weights = (10.0, 1.0, 4.0, 2.0)
+
+    def document_sql(self):
+        return f'''
+            SELECT p.id, p.name, p.description,
+                   COALESCE((SELECT group_concat(a.name || ' ' || v.value, ' ')
+                               FROM {ProductAttribute._meta.db_table} pa
+                               JOIN {Attribute._meta.db_table} a ON a.id = pa.attribute_id
+                               JOIN {AttributeValue._meta.db_table} v ON v.id = pa.attribute_value_id
+                              WHERE pa.product_id = p.id), ''),
+                   s.name
+              FROM {Product._meta.db_table} p
+              JOIN {SubCategory._meta.db_table} s ON s.id = p.sub_category_id
+        '''
+
+    def index(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, attributes, sub_category) '
+                f'{self.document_sql()} WHERE p.id IN ({placeholders})',
+                product_ids,
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, attributes, sub_category) '
+                f'{self.document_sql()}'
+            )
+        bump_model_version(Product)
+
+    def search(self, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Every term must match; each one also matches as a prefix so "sams gal" finds "Samsung Galaxy".
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    return import_string(settings.OLCHA_SEARCH_BACKEND)()
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    ``?search=`` backed by the configured search backend.
+
+    Matches are annotated with ``search_rank`` (1 = best), which
+    CreatedAtCursorPagination uses as its key unless ``?ordering=`` is given.
+
+    Only the ``max_results`` best matches are kept, also when another
+    ``?ordering=`` is asked for. ``request.search_truncated`` records whether
+    more matched, and the paginated response reports it so clients can ask
+    for a narrower query instead of assuming they saw everything.
+    """
+    search_param = 'search'
+    max_results = 1000
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        product_ids = get_search_backend().search(query, self.max_results + 1)
+        request.search_truncated = len(product_ids) > self.max_results
+        product_ids = product_ids[:self.max_results]
+        return queryset.filter(pk__in=product_ids).annotate(search_rank=Case(
+            *[When(pk=product_id, then=Value(rank)) for rank, product_id in enumerate(product_ids, 1)],
+            output_field=IntegerField(),
+        ))
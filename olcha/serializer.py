@@ -1,28 +1,73 @@
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
 from rest_framework import serializers
 from olcha.models import Product, Category, SubCategory, Attribute, AttributeValue, ProductAttribute, Image, Comment, \
     Order, OrderItem
+from olcha.authentication import get_full_user
+from olcha.cache import bump_model_version
+from olcha.compact import CompactSerializer, image_url, iso_datetime
+from olcha.images import srcset
+from olcha.stock import OutOfStock, reserve_basket
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Keeps only the readable fields named in the ``fields`` context entry, when there is one."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        if selected is not None:
+            for name in [name for name, field in fields.items() if not field.write_only and name not in selected]:
+                del fields[name]
+        return fields
+
+
+class SrcsetMixin:
+    """Adds the ``srcset`` of the ``image`` field's resized variants (see olcha.images)."""
+
+    def get_srcset(self, instance):
+        return srcset(self.context.get('request'), instance.image.name)
+
+
+class CategorySerializer(SrcsetMixin, serializers.ModelSerializer):
     subcategories = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     class Meta:
         model = Category
-        fields = ['id', 'name', 'image', 'slug', 'subcategories']
+        fields = ['id', 'name', 'image', 'srcset', 'slug', 'subcategories']
 
     def get_subcategories(self, instance):
+        # CategoryViewSet annotates the count; fall back for freshly saved rows.
+        if hasattr(instance, 'subcategories_count'):
+            return instance.subcategories_count
         return instance.sub_categories.count()
 
-class SubCategorySerializer(serializers.ModelSerializer):
+class CategoryCompactSerializer(CompactSerializer):
+    """CategorySerializer's schema from ``.values()``; needs the ``subcategories_count`` annotation."""
+    columns = {'id': 'id', 'name': 'name', 'image': 'image', 'srcset': 'image', 'slug': 'slug',
+               'subcategories': 'subcategories_count'}
+
+    def to_representation(self, row):
+        data = super().to_representation(row)
+        if 'image' in data:
+            data['image'] = image_url(self.context.get('request'), data['image'])
+        if 'srcset' in data:
+            data['srcset'] = srcset(self.context.get('request'), data['srcset'])
+        return data
+
+
+class SubCategorySerializer(SrcsetMixin, serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(), source='category', write_only=True
     )
 
     class Meta:
         model = SubCategory
-        fields = ['id', 'name', 'image', 'slug', 'category_id']
+        fields = ['id', 'name', 'image', 'srcset', 'slug', 'category_id']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     sub_category_id = serializers.PrimaryKeyRelatedField(
         queryset=SubCategory.objects.all(), source='sub_category', write_only=True
     )
@@ -30,6 +75,25 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id','name', 'price', 'quantity', 'discount', 'description', 'rating', 'slug', 'sub_category_id']
+        read_only_fields = ['rating']
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    """One row of a bulk import; ``sub_category`` is a sub category id or slug, ``slug`` is the upsert key."""
+    name = serializers.CharField(max_length=50)
+    slug = serializers.SlugField(max_length=50, required=False, allow_blank=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    quantity = serializers.IntegerField(min_value=0)
+    discount = serializers.FloatField(default=0)
+    description = serializers.CharField(allow_blank=True, default='')
+    sub_category = serializers.CharField(max_length=50)
+    attributes = serializers.DictField(child=serializers.CharField(max_length=50), required=False)
+
+
+class ProductCompactSerializer(CompactSerializer):
+    """ProductSerializer's read schema from ``.values()``; ``price`` stays a Decimal for CompactJSONRenderer."""
+    columns = {field: field for field in
+               ('id', 'name', 'price', 'quantity', 'discount', 'description', 'rating', 'slug')}
 
 
 class AttributeSerializer(serializers.ModelSerializer):
@@ -53,10 +117,12 @@ class ProductAtrributeSerializer(serializers.ModelSerializer):
         fields = ['attribute', 'attribute_value']
 
 
-class ImageSerializer(serializers.ModelSerializer):
+class ImageSerializer(SrcsetMixin, serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Image
-        fields = ['image']
+        fields = ['image', 'srcset']
 
 class CommentSerializer(serializers.ModelSerializer):
     username = serializers.SerializerMethodField()
@@ -69,7 +135,17 @@ class CommentSerializer(serializers.ModelSerializer):
         return obj.user.username
 
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class CommentCompactSerializer(CompactSerializer):
+    columns = {'username': 'user__username', 'comment': 'comment', 'rating': 'rating', 'created_at': 'created_at'}
+
+    def to_representation(self, row):
+        data = super().to_representation(row)
+        if 'created_at' in data:
+            data['created_at'] = iso_datetime(data['created_at'])
+        return data
+
+
+class ProductDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product_attribute = ProductAtrributeSerializer(many=True, read_only=True)
     image = ImageSerializer(many=True, read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
@@ -77,13 +153,32 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'price', 'quantity', 'discount', 'description', 'rating', 'slug', 'image', 'comments', 'product_attribute']
+        read_only_fields = ['rating']
+
 
 
+class OwnOrderField(serializers.PrimaryKeyRelatedField):
+    def get_queryset(self):
+        return Order.objects.filter(user__pk=self.context['request'].user.pk)
+
+
+class StockReservationMixin:
+    """Turns OutOfStock raised by OrderItem.save into a 400 on ``quantity``, as checkout does for ``items``."""
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        except OutOfStock as exc:
+            raise serializers.ValidationError({'quantity': [str(exc)]})
+
+
+class OrderItemSerializer(StockReservationMixin, serializers.ModelSerializer):
+    order = OwnOrderField()
 
-class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['order', 'product', 'quantity', 'price']
+        extra_kwargs = {'quantity': {'min_value': 1}}
 
 
 
@@ -99,7 +194,50 @@ class OrderSerializer(serializers.ModelSerializer):
         return obj.user.username
 
 
-class OrderItemDetailSerializer(serializers.ModelSerializer):
+class OrderItemDetailSerializer(StockReservationMixin, serializers.ModelSerializer):
+    order = OwnOrderField()
+
     class Meta:
         model = OrderItem
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        extra_kwargs = {'quantity': {'min_value': 1}}
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    address = serializers.CharField(max_length=50)
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        products = Product.objects.in_bulk({item['product'] for item in items})
+        missing = sorted({item['product'] for item in items} - products.keys())
+        if missing:
+            raise serializers.ValidationError(f'Unknown products: {missing}')
+        for item in items:
+            item['product'] = products[item['product']]
+        return items
+
+    def create(self, validated_data):
+        items = validated_data['items']
+        try:
+            with transaction.atomic():
+                reserve_basket((item['product'].pk, item['quantity']) for item in items)
+                order = Order.objects.create(user=get_full_user(self.context['request'].user), address=validated_data['address'])
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product=item['product'], quantity=item['quantity'],
+                              price=item['product'].price)
+                    for item in items
+                ])
+                total = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order').annotate(
+                    total=Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=10, decimal_places=2))
+                ).values('total')
+                Order.objects.filter(pk=order.pk).update(total_price=Subquery(total))
+                bump_model_version(Order, OrderItem, scope=order.user_id)
+        except OutOfStock as exc:
+            raise serializers.ValidationError({'items': [str(exc)]})
+        order.refresh_from_db(fields=['total_price'])
+        return order
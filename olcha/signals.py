@@ -1,37 +1,217 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from olcha.models import Order, Comment, Product
-from django.utils.timezone import now
-import logging
+from django.contrib.auth.models import User
+from olcha.attributes import attribute_names, attribute_values
+from olcha.authentication import user_cache
+from olcha.cache import invalidate_product_detail, bump_model_version
+from olcha.facets import adjust_product_facets, rebuild_facet_counts
+from olcha.images import schedule_variants
+from olcha.models import Order, Comment, Product, ProductAttribute, Image, Attribute, AttributeValue, SubCategory, \
+    Category, OrderItem, ProductTombstone
+from olcha.ratings import adjust_product_rating
+from olcha.search import get_search_backend
+from olcha.sqlite import apply_pragmas
+from olcha.stock import release_stock
+from olcha.tasks import enqueue
 
-logger = logging.getLogger(__name__)
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, settings.OLCHA_SQLITE_PRAGMAS)
+
+
+def username_may_have_changed(created, update_fields):
+    """
+    Whether a User save can have changed the username that orders, comments and cached responses show.
+
+    Every login saves the user with ``update_fields=['last_login']``; those saves leave all of them valid.
+    """
+    return not created and (update_fields is None or 'username' in update_fields)
 
 
 @receiver(post_save, sender=Order)
 def order_created_handler(sender, instance, created, **kwargs):
     if created:
-        logger.info(f"New Order created: {instance.id} at {now()}")
+        enqueue('log_new_orders', instance.id)
 
 
 @receiver(post_save, sender=Comment)
 def update_product_rating_on_comment(sender, instance, created, **kwargs):
+    snapshot = getattr(instance, '_rating_snapshot', None)
     if created:
-        product = instance.product
-        comments = product.comment_set.all()
-        avg_rating = sum([c.rating for c in comments]) / comments.count()
-        product.rating = avg_rating
-        product.save()
-        logger.info(f"Updated product ({product.id}) average rating to {avg_rating}")
+        adjust_product_rating(instance.product_id, instance.rating, 1)
+    elif snapshot is None:
+        # Saved from an instance that was never loaded, so the previous rating is unknown; recount to repair.
+        enqueue('recount_product_ratings', instance.product_id)
+    elif snapshot[0] != instance.product_id:
+        adjust_product_rating(snapshot[0], -snapshot[1], -1)
+        adjust_product_rating(instance.product_id, instance.rating, 1)
+    elif snapshot[1] != instance.rating:
+        adjust_product_rating(instance.product_id, instance.rating - snapshot[1], 0)
+    instance._rating_snapshot = (instance.product_id, instance.rating)
 
 
 @receiver(post_delete, sender=Comment)
 def update_product_rating_on_comment_delete(sender, instance, **kwargs):
-    product = instance.product
-    comments = product.comment_set.all()
-    if comments.exists():
-        avg_rating = sum([c.rating for c in comments]) / comments.count()
-    else:
-        avg_rating = 0
-    product.rating = avg_rating
-    product.save()
-    logger.info(f"Updated product ({product.id}) rating after comment deleted to {avg_rating}")
+    product_id, rating = getattr(instance, '_rating_snapshot', (instance.product_id, instance.rating))
+    adjust_product_rating(product_id, -rating, -1)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_detail_on_product(sender, instance, **kwargs):
+    invalidate_product_detail(instance.pk)
+
+
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_product_detail_on_child(sender, instance, **kwargs):
+    invalidate_product_detail(instance.product_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_product_detail_on_username(sender, instance, created, update_fields=None, **kwargs):
+    if username_may_have_changed(created, update_fields):
+        invalidate_product_detail(*instance.comments.values_list('product_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=Attribute)
+@receiver(post_save, sender=AttributeValue)
+def invalidate_product_detail_on_attribute(sender, instance, created, **kwargs):
+    if not created:
+        product_ids = instance.product_attribute.values_list('product_id', flat=True)
+        invalidate_product_detail(*product_ids)
+
+
+@receiver(post_save, sender=Attribute)
+@receiver(post_delete, sender=Attribute)
+@receiver(post_save, sender=AttributeValue)
+@receiver(post_delete, sender=AttributeValue)
+def forget_interned_names(sender, instance, created=False, **kwargs):
+    if not created:
+        (attribute_names if sender is Attribute else attribute_values).forget()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    ProductTombstone.objects.create(product_id=instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+def reindex_product_attributes(sender, instance, **kwargs):
+    get_search_backend().index([instance.product_id])
+
+
+@receiver(post_save, sender=SubCategory)
+def reindex_sub_category_products(sender, instance, created, **kwargs):
+    if not created:
+        get_search_backend().index(instance.product.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Attribute)
+@receiver(post_save, sender=AttributeValue)
+def reindex_attribute_products(sender, instance, created, **kwargs):
+    if not created:
+        get_search_backend().index(instance.product_attribute.values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender=ProductAttribute)
+def update_facet_counts_on_product_attribute(sender, instance, created, **kwargs):
+    current = (instance.product_id, instance.attribute_id, instance.attribute_value_id)
+    snapshot = getattr(instance, '_facet_snapshot', None)
+    if created:
+        adjust_product_facets(*current, 1)
+    elif snapshot is None:
+        rebuild_facet_counts([instance.product.sub_category_id])
+    elif snapshot != current:
+        adjust_product_facets(*snapshot, -1)
+        adjust_product_facets(*current, 1)
+    instance._facet_snapshot = current
+
+
+@receiver(post_delete, sender=ProductAttribute)
+def update_facet_counts_on_product_attribute_delete(sender, instance, **kwargs):
+    snapshot = getattr(instance, '_facet_snapshot',
+                       (instance.product_id, instance.attribute_id, instance.attribute_value_id))
+    adjust_product_facets(*snapshot, -1)
+
+
+@receiver(post_save, sender=Product)
+def move_facet_counts_on_sub_category_change(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_sub_category_snapshot', None)
+    if not created and previous is not None and previous != instance.sub_category_id:
+        rebuild_facet_counts([previous, instance.sub_category_id])
+    instance._sub_category_snapshot = instance.sub_category_id
+
+
+VERSIONED_MODELS = (Category, SubCategory, Product, ProductAttribute, Attribute, AttributeValue, Image, Comment,
+                    User)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_cached_response_version(sender, created=False, update_fields=None, **kwargs):
+    if sender not in VERSIONED_MODELS:
+        return
+    if sender is User and not username_may_have_changed(created, update_fields):
+        return
+    bump_model_version(sender)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def bump_order_version(sender, instance, **kwargs):
+    bump_model_version(Order, scope=instance.user_id)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def bump_order_item_version(sender, instance, **kwargs):
+    user_id = Order.objects.filter(pk=instance.order_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_model_version(OrderItem, scope=user_id)
+
+
+@receiver(post_delete, sender=OrderItem)
+def release_order_item_stock(sender, instance, **kwargs):
+    # OrderItem.save reserves the stock; deleting the item, or its order, gives it back.
+    if instance.quantity > 0:
+        release_stock(instance.product_id, instance.quantity)
+
+
+@receiver(post_save, sender=User)
+def bump_user_order_version(sender, instance, created, update_fields=None, **kwargs):
+    if username_may_have_changed(created, update_fields):
+        bump_model_version(Order, scope=instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    user_cache.forget(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_save, sender=Image)
+def render_image_variants(sender, instance, **kwargs):
+    schedule_variants(instance.image.name)
@@ -0,0 +1,40 @@
+from django.db.models import Q
+from django.utils.text import slugify
+
+LOOKUP_CHUNK = 200
+
+
+def slug_stem(name, max_length):
+    return slugify(name)[:max_length - 6].strip('-') or 'item'
+
+
+def unique_slugs(model, names, taken=(), field='slug'):
+    """
+    One free slug per name, ``slugify(name)`` or ``slugify(name)-<n>``.
+
+    Taken slugs are fetched per batch of stems instead of probing the table
+    once per collision. Slugs in ``taken`` are treated as used, so a
+    caller can reserve slugs for rows it has not written yet.
+    """
+    max_length = model._meta.get_field(field).max_length
+    stems = [slug_stem(name, max_length) for name in names]
+    used = set(taken)
+    distinct = sorted(set(stems))
+    # Chunked to keep the OR chain under SQLite's expression depth limit.
+    for start in range(0, len(distinct), LOOKUP_CHUNK):
+        chunk = distinct[start:start + LOOKUP_CHUNK]
+        lookup = Q(**{f'{field}__in': chunk})
+        for stem in chunk:
+            # '-' < slug < '.' is "starts with stem-" as a range the unique index can answer.
+            lookup |= Q(**{f'{field}__gt': f'{stem}-', f'{field}__lt': f'{stem}.'})
+        used.update(model._default_manager.filter(lookup).values_list(field, flat=True))
+
+    slugs = []
+    for stem in stems:
+        slug, n = stem, 1
+        while slug in used:
+            n += 1
+            slug = f'{stem}-{n}'
+        used.add(slug)
+        slugs.append(slug)
+    return slugs
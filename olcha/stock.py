@@ -0,0 +1,62 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from olcha.cache import invalidate_product_detail, bump_model_version
+from olcha.models import Product
+
+
+class OutOfStock(ValueError):
+    def __init__(self, product_id, quantity):
+        self.product_id = product_id
+        self.quantity = quantity
+        super().__init__(f'Not enough stock for product {product_id} (requested {quantity})')
+
+
+def check_quantity(quantity):
+    # A negative reservation would pass the ``quantity >= n`` guard and add stock.
+    if quantity < 1:
+        raise ValueError(f'Stock is reserved and released in positive quantities, not {quantity}')
+
+
+def reserve_stock(product_id, quantity):
+    """
+    Take ``quantity`` units with one conditional UPDATE.
+
+    The ``quantity >= n`` guard is evaluated by the database while it holds
+    the row's write lock, so two concurrent checkouts can never both take
+    the last unit.
+    """
+    check_quantity(quantity)
+    updated = Product.objects.filter(pk=product_id, quantity__gte=quantity).update(
+        quantity=F('quantity') - quantity, updated_at=now()
+    )
+    if not updated:
+        raise OutOfStock(product_id, quantity)
+    invalidate_product_detail(product_id)
+    bump_model_version(Product)
+
+
+def release_stock(product_id, quantity):
+    check_quantity(quantity)
+    Product.objects.filter(pk=product_id).update(quantity=F('quantity') + quantity, updated_at=now())
+    invalidate_product_detail(product_id)
+    bump_model_version(Product)
+
+
+def reserve_basket(lines):
+    """
+    Reserve every ``(product_id, quantity)`` pair or none of them.
+
+    Rows are locked in product id order so two baskets sharing products
+    cannot deadlock on databases with row-level locks.
+    """
+    basket = Counter()
+    for product_id, quantity in lines:
+        basket[product_id] += quantity
+    with transaction.atomic():
+        for product_id in sorted(basket):
+            reserve_stock(product_id, basket[product_id])
+    return basket
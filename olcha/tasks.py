@@ -0,0 +1,162 @@
+"""
+Background tasks for signal side effects, with a persistent outbox.
+
+``enqueue(name, *keys)`` inserts Task rows in the writer's transaction, so
+queued work commits or rolls back with the write that caused it, and wakes
+the worker once that transaction commits. A key that is already waiting is
+not queued again: a product queued for a rating recount a hundred times
+before the worker runs is recounted once.
+
+The worker claims due rows in batches with a conditional UPDATE, leasing
+them for ``OLCHA_TASK_LEASE`` seconds so other processes skip them (SQLite
+has no SELECT ... FOR UPDATE SKIP LOCKED), and calls each
+handler once per batch with the batch's keys. Failed tasks are retried
+with exponential backoff up to ``OLCHA_TASK_MAX_ATTEMPTS`` times, then
+kept with ``run_after = NULL`` and their last error for
+``OLCHA_TASK_RETENTION`` seconds. Completed rows are deleted right away.
+Handlers must be idempotent: a lease that expires mid-run is picked up
+again.
+
+By default every process that queues work drains the outbox in a worker
+thread (``OLCHA_TASK_WORKER``). With ``TASK_WORKER=0`` in the environment
+it only queues, and ``manage.py run_tasks`` does the work.
+"""
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from olcha.models import Order, Task
+from olcha.ratings import rebuild_product_ratings
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+
+
+def task(function):
+    """Register ``function(keys)`` under its name; it receives the distinct keys of a batch as strings."""
+    handlers[function.__name__] = function
+    return function
+
+
+def enqueue(name, *keys):
+    Task.objects.bulk_create([Task(name=name, key=str(key)) for key in dict.fromkeys(keys)], ignore_conflicts=True)
+    transaction.on_commit(worker.wake)
+
+
+def claim(batch_size):
+    """
+    Lease up to ``batch_size`` due rows with one conditional UPDATE.
+
+    The UPDATE re-checks that each row is still unclaimed (or its lease
+    expired), so when workers race for a row only one of them stamps its
+    token on it; the worker then reads back the rows carrying its token.
+    """
+    now = timezone.now()
+    due = Q(claimed_until__isnull=True, run_after__lte=now) | Q(claimed_until__lt=now)
+    token = uuid.uuid4()
+    candidates = Task.objects.filter(due).order_by('id').values('id')[:batch_size]
+    claimed = Task.objects.filter(due, pk__in=candidates).update(
+        claimed_until=now + timedelta(seconds=settings.OLCHA_TASK_LEASE), claimed_by=token
+    )
+    if not claimed:
+        return []
+    return list(Task.objects.filter(claimed_by=token).order_by('id').values('id', 'name', 'key', 'attempts'))
+
+
+def fail(rows, error):
+    now = timezone.now()
+    for row in rows:
+        attempts = row['attempts'] + 1
+        run_after = None
+        if attempts < settings.OLCHA_TASK_MAX_ATTEMPTS:
+            run_after = now + timedelta(seconds=settings.OLCHA_TASK_RETRY_DELAY * 2 ** (attempts - 1))
+        try:
+            with transaction.atomic():
+                Task.objects.filter(pk=row['id']).update(
+                    attempts=attempts, run_after=run_after, claimed_until=None, claimed_by=None,
+                    last_error=repr(error), updated_at=now,
+                )
+        except IntegrityError:
+            # The same work was queued again meanwhile; the waiting row covers it.
+            Task.objects.filter(pk=row['id']).delete()
+        if run_after is None:
+            logger.error(f"Task {row['name']}({row['key']}) gave up after {attempts} attempts: {error!r}")
+
+
+def prune():
+    """Delete tasks that gave up more than ``OLCHA_TASK_RETENTION`` seconds ago."""
+    cutoff = timezone.now() - timedelta(seconds=settings.OLCHA_TASK_RETENTION)
+    return Task.objects.filter(run_after__isnull=True, updated_at__lt=cutoff).delete()[0]
+
+
+def run_pending(batch_size=None):
+    """Run due tasks until none are left; returns how many rows completed."""
+    batch_size = batch_size or settings.OLCHA_TASK_BATCH_SIZE
+    prune()
+    completed = 0
+    while rows := claim(batch_size):
+        batches = {}
+        for row in rows:
+            batches.setdefault(row['name'], []).append(row)
+        for name, batch in batches.items():
+            try:
+                with transaction.atomic():
+                    handlers[name](list(dict.fromkeys(row['key'] for row in batch)))
+            except Exception as error:
+                logger.warning(f'Task {name} failed for {len(batch)} keys: {error!r}')
+                fail(batch, error)
+            else:
+                Task.objects.filter(pk__in=[row['id'] for row in batch]).delete()
+                completed += len(batch)
+    return completed
+
+
+class Worker:
+    """In-process worker thread, woken after each commit that queued work and every ``OLCHA_TASK_POLL`` seconds."""
+
+    def __init__(self):
+        self.thread = None
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+
+    def wake(self):
+        if not settings.OLCHA_TASK_WORKER:
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.loop, name='olcha-tasks', daemon=True)
+                self.thread.start()
+        self.event.set()
+
+    def loop(self):
+        while True:
+            self.event.wait(settings.OLCHA_TASK_POLL)
+            self.event.clear()
+            try:
+                run_pending()
+            except Exception:
+                logger.exception('Task worker failed')
+            finally:
+                close_old_connections()
+
+
+worker = Worker()
+
+
+@task
+def recount_product_ratings(product_ids):
+    rebuild_product_ratings(product_ids)
+    logger.info(f"Updated product ({', '.join(product_ids)}) rating aggregates")
+
+
+@task
+def log_new_orders(order_ids):
+    for order_id, created_at in Order.objects.filter(pk__in=order_ids).values_list('id', 'created_at'):
+        logger.info(f"New Order created: {order_id} at {created_at}")
@@ -1,3 +1,1142 @@
-from django.test import TestCase
+import gzip
+import io
+import itertools
+import json
+import os
+import threading
+import re
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User, update_last_login
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, connections, transaction, IntegrityError, OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from django.urls.resolvers import RoutePattern
+from PIL import Image as PILImage
+from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.tokens import AccessToken
+
+from olcha.models import Category, SubCategory, Product, Comment, Order, OrderItem, Attribute, AttributeValue, \
+    ProductAttribute, Image, Task
+from olcha.attributes import attribute_names
+from olcha.cache import bump_model_version, get_model_versions, model_version_key
+from olcha.authentication import user_cache
+from olcha.images import VARIANT_FORMATS, render_variants, srcset, variant_name
+from olcha.media import HASHED_NAME, media_storage
+from olcha.facets import precomputed_facets, live_facets, rebuild_facet_counts
+from olcha.search import ProductSearchFilter, get_search_backend
+from olcha.serializer import ProductCompactSerializer
+from olcha.stock import OutOfStock, reserve_basket, reserve_stock
+from olcha.tasks import claim, enqueue, handlers, run_pending
+from olcha import passwords, views
+from olcha.passwords import recent_logins
+from olcha.urls import router, urlpatterns
 
 # Create your tests here.
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class CatalogFixtureMixin:
+    """Builders for the rows a test needs; every test creates only what it reads."""
+    sequence = itertools.count(1)
+
+    def auth_headers(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+    def make_user(self):
+        return User.objects.create_user(username=f'user{next(self.sequence)}', password='secret')
+
+    def make_sub_category(self):
+        n = next(self.sequence)
+        category = Category.objects.create(name=f'category {n}', image='images/c.png', slug=f'category-{n}')
+        return SubCategory.objects.create(name=f'sub {n}', image='images/s.png', slug=f'sub-{n}', category=category)
+
+    def make_product(self, sub_category=None, **fields):
+        n = next(self.sequence)
+        return Product.objects.create(**{
+            'name': f'product {n}', 'price': '10.00', 'quantity': 100, 'discount': 0, 'description': 'text',
+            'slug': f'product-{n}', 'sub_category': sub_category or self.make_sub_category(), **fields,
+        })
+
+    def make_products(self, size):
+        sub_category = self.make_sub_category()
+        return [self.make_product(sub_category) for _ in range(size)]
+
+    def link_attribute(self, product):
+        n = next(self.sequence)
+        return ProductAttribute.objects.create(
+            product=product,
+            attribute=Attribute.objects.create(name=f'attribute {n}'),
+            attribute_value=AttributeValue.objects.create(value=f'value {n}'),
+        )
+
+    def make_comment(self, product, user=None, rating=5):
+        return Comment.objects.create(user=user or self.make_user(), product=product, comment='nice', rating=rating)
+
+    def make_order(self, user=None, products=()):
+        order = Order.objects.create(user=user or self.make_user(), address='Tashkent')
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+        return order
+
+    def make_catalog(self, size):
+        """``size`` products with every child row the catalog documents show, all ordered by one user."""
+        user = self.make_user()
+        products = []
+        for _ in range(size):
+            product = self.make_product()
+            self.link_attribute(product)
+            Image.objects.create(product=product, image='media/p.png')
+            self.make_comment(product, user)
+            products.append(product)
+        return self.make_order(user, products)
+
+
+def budgeted_endpoints():
+    """Yield ``(url template, view class)`` for every olcha GET endpoint that declares a query budget."""
+    for prefix, viewset, basename in router.registry:
+        yield f'/Olcha/{prefix}/', viewset
+        yield f'/Olcha/{prefix}/{{pk}}/', viewset
+    for pattern in urlpatterns:
+        view_class = getattr(getattr(pattern, 'callback', None), 'cls', None)
+        if view_class is None or not isinstance(pattern.pattern, RoutePattern):
+            continue
+        yield '/Olcha/' + re.sub(r'<int:(\w+)>', r'{\1}', str(pattern.pattern)), view_class
+
+
+@override_settings(CACHES=NO_CACHE)
+class QueryBudgetTests(CatalogFixtureMixin, TestCase):
+    def measure(self):
+        product = Product.objects.latest('id')
+        counts = {}
+        for template, view_class in budgeted_endpoints():
+            if getattr(view_class, 'query_budget', None) is None:
+                continue
+            url = template.format(
+                pk=view_class.queryset.model.objects.latest('id').pk,
+                category_id=product.sub_category.category_id,
+                subcategory_id=product.sub_category_id,
+            )
+            headers = {}
+            if IsAuthenticated in view_class.permission_classes:
+                headers = self.auth_headers(Order.objects.latest('id').user)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertLessEqual(
+                len(queries), view_class.query_budget,
+                f'{url} ran {len(queries)} queries:\n' + '\n'.join(q['sql'] for q in queries),
+            )
+            counts[template] = len(queries)
+        return counts
+
+    def test_endpoints_stay_within_budget(self):
+        self.make_catalog(1)
+        small = self.measure()
+        self.make_catalog(25)
+        large = self.measure()
+        self.assertTrue(small)
+        self.assertEqual(small, large)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ProductDetailCacheTests(CatalogFixtureMixin, TestCase):
+    def test_detail_is_cached_until_a_child_row_changes(self):
+        product = self.make_product()
+        link = self.link_attribute(product)
+        Image.objects.create(product=product, image='media/p.png')
+        url = f'/Olcha/products-detail/{product.pk}/'
+
+        first = self.client.get(url).json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json(), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Image.objects.create(product=product, image='media/second.png')
+        self.assertEqual(len(self.client.get(url).json()['image']), 2)
+
+        value = link.attribute_value
+        value.value = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            value.save()
+        self.assertEqual(self.client.get(url).json()['product_attribute'][0]['attribute_value']['value'], 'renamed')
+
+    def test_detail_follows_the_host_and_commenter_renames(self):
+        product = self.make_product()
+        Image.objects.create(product=product, image='media/p.png')
+        author = self.make_comment(product).user
+        url = f'/Olcha/products-detail/{product.pk}/'
+
+        self.assertTrue(self.client.get(url).json()['image'][0]['image'].startswith('http://testserver/'))
+        other = self.client.get(url, HTTP_HOST='shop.example.com').json()
+        self.assertTrue(other['image'][0]['image'].startswith('http://shop.example.com/'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_last_login(None, author)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        author.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            author.save()
+        self.assertEqual(self.client.get(url).json()['comments'][0]['username'], 'renamed')
+
+
+class ProductRatingTests(CatalogFixtureMixin, TestCase):
+    def assertRating(self, product, rating_sum, rating_count, rating):
+        product.refresh_from_db()
+        self.assertEqual((product.rating_sum, product.rating_count, product.rating), (rating_sum, rating_count, rating))
+
+    def test_comment_writes_adjust_the_aggregate(self):
+        first, second = self.make_products(2)
+        user = self.make_user()
+        for product in (first, second):
+            self.make_comment(product, user)
+        self.assertRating(first, 5, 1, 5)
+
+        with CaptureQueriesContext(connection) as queries:
+            comment = Comment.objects.create(user=user, product=first, comment='meh', rating=2)
+        self.assertFalse([q['sql'] for q in queries if 'olcha_comment' in q['sql'] and 'SELECT' in q['sql']])
+        self.assertFalse(Task.objects.exists())
+        self.assertRating(first, 7, 2, 4)
+
+        comment = Comment.objects.get(pk=comment.pk)
+        comment.rating = 4
+        comment.save()
+        self.assertRating(first, 9, 2, 5)
+
+        comment.product = second
+        comment.save()
+        self.assertRating(first, 5, 1, 5)
+        self.assertRating(second, 9, 2, 5)
+
+        comment.delete()
+        self.assertRating(second, 5, 1, 5)
+        Comment.objects.filter(product=second).get().delete()
+        self.assertRating(second, 0, 0, Product.RatingChoices.ONE)
+
+    def test_rebuild_command(self):
+        for product in self.make_products(3):
+            self.make_comment(product)
+        Product.objects.update(rating_sum=0, rating_count=0, rating=1)
+        call_command('rebuild_product_ratings', stdout=open(os.devnull, 'w'))
+        for product in Product.objects.all():
+            self.assertRating(product, 5, 1, 5)
+
+
+class StockReservationTests(CatalogFixtureMixin, TestCase):
+    def test_basket_is_all_or_nothing(self):
+        first, second = self.make_products(2)
+        with self.assertRaises(OutOfStock):
+            reserve_basket([(first.pk, 5), (second.pk, 1000)])
+        first.refresh_from_db()
+        self.assertEqual(first.quantity, 100)
+
+        reserve_basket([(second.pk, 3), (first.pk, 4), (second.pk, 2)])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.quantity, second.quantity), (96, 95))
+
+    def test_order_item_update_moves_the_reservation(self):
+        order = self.make_order(products=[self.make_product()])
+        item = order.items.get()
+        item.quantity = 10
+        item.save()
+        self.assertEqual(Product.objects.get(pk=item.product_id).quantity, 90)
+
+    def test_order_item_endpoints_reject_more_than_the_stock(self):
+        order = self.make_order(products=[self.make_product()])
+        item = order.items.get()
+        me = self.auth_headers(order.user)
+        response = self.client.post('/Olcha/orderitem/', {
+            'order': order.pk, 'product': item.product_id, 'quantity': 1000, 'price': '1.00',
+        }, content_type='application/json', **me)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.json())
+
+        response = self.client.patch(f'/Olcha/order-item-detail/{item.pk}/', {'quantity': 1000},
+                                     content_type='application/json', **me)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.get(pk=item.product_id).quantity, 99)
+        self.assertEqual(OrderItem.objects.get(pk=item.pk).quantity, 1)
+
+    def test_order_items_need_a_positive_quantity(self):
+        order = self.make_order(products=[self.make_product()])
+        item = order.items.get()
+        me = self.auth_headers(order.user)
+        response = self.client.post('/Olcha/orderitem/', {
+            'order': order.pk, 'product': item.product_id, 'quantity': -1000, 'price': '1.00',
+        }, content_type='application/json', **me)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'/Olcha/order-item-detail/{item.pk}/', {'quantity': 0},
+                                     content_type='application/json', **me)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.get(pk=item.product_id).quantity, 99)
+        with self.assertRaises(ValueError):
+            reserve_stock(item.product_id, -1)
+
+    def test_deleting_order_items_releases_their_stock(self):
+        first, second = self.make_products(2)
+        order = self.make_order(products=[first, second])
+        response = self.client.delete(f'/Olcha/order-item-detail/{order.items.get(product=first).pk}/',
+                                      **self.auth_headers(order.user))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Product.objects.get(pk=first.pk).quantity, 100)
+        order.delete()
+        self.assertEqual(Product.objects.get(pk=second.pk).quantity, 100)
+
+
+class StockConcurrencyTests(CatalogFixtureMixin, TransactionTestCase):
+    threads = 8
+    attempts = 20
+
+    def test_concurrent_checkouts_never_oversell(self):
+        product = self.make_product(quantity=50)
+        sold = []
+        start = threading.Barrier(self.threads)
+
+        def buyer():
+            start.wait()
+            try:
+                for _ in range(self.attempts):
+                    while True:
+                        try:
+                            reserve_stock(product.pk, 1)
+                            sold.append(1)
+                        except OutOfStock:
+                            pass
+                        except OperationalError:
+                            continue  # SQLite reports a busy writer; retry like a client would.
+                        break
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=buyer) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        product.refresh_from_db()
+        self.assertEqual(len(sold), 50)
+        self.assertEqual(product.quantity, 0)
+
+
+@override_settings(CACHES=NO_CACHE)
+class CheckoutTests(CatalogFixtureMixin, TestCase):
+    def checkout(self, user, items):
+        return self.client.post('/Olcha/checkout/', {'address': 'Tashkent', 'items': items},
+                                content_type='application/json', **self.auth_headers(user))
+
+    def test_checkout_creates_order_items_and_total(self):
+        user = self.make_user()
+        first, second = self.make_products(2)
+        response = self.checkout(user, [
+            {'product': first.pk, 'quantity': 2},
+            {'product': second.pk, 'quantity': 1},
+            {'product': first.pk, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 201, response.content)
+        order = Order.objects.get(pk=response.json()['id'])
+        self.assertEqual(order.user, user)
+        self.assertEqual(str(order.total_price), '40.00')
+        self.assertEqual(order.items.count(), 3)
+        first.refresh_from_db()
+        self.assertEqual(first.quantity, 97)
+
+    def test_checkout_rolls_back_when_any_line_is_short(self):
+        user = self.make_user()
+        first, second = self.make_products(2)
+        response = self.checkout(user, [{'product': first.pk, 'quantity': 1}, {'product': second.pk, 'quantity': 500}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        first.refresh_from_db()
+        self.assertEqual(first.quantity, 100)
+
+    def test_checkout_requires_authentication(self):
+        self.assertEqual(self.client.post('/Olcha/checkout/', {}, content_type='application/json').status_code, 401)
+
+
+@override_settings(CACHES=NO_CACHE)
+class CursorPaginationTests(CatalogFixtureMixin, TestCase):
+    def test_walks_every_product_once_with_constant_queries(self):
+        self.make_products(25)
+        seen = []
+        url = '/Olcha/products/?page_size=10'
+        while url:
+            with self.assertNumQueries(1):
+                page = self.client.get(url).json()
+            seen.extend(row['id'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(seen, list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_follows_the_active_ordering(self):
+        self.make_products(4)
+        self.make_product(price='1.00')
+        page = self.client.get('/Olcha/products/?ordering=price&page_size=2').json()
+        self.assertEqual(page['results'][0]['price'], '1.00')
+        self.assertIsNotNone(page['next'])
+
+
+@override_settings(CACHES=NO_CACHE)
+class ProductSearchTests(CatalogFixtureMixin, TestCase):
+    def search(self, query):
+        return [row['id'] for row in self.client.get('/Olcha/products/', {'search': query}).json()['results']]
+
+    def test_ranked_prefix_search_stays_in_sync(self):
+        first, second, third = self.make_products(3)
+        link = self.link_attribute(third)
+        Product.objects.filter(pk=first.pk).update(description='works with any galaxy phone')
+        get_search_backend().index([first.pk])
+        second.name = 'Samsung Galaxy'
+        second.save()
+
+        self.assertEqual(self.search('sams gal'), [second.pk])
+        self.assertEqual(self.search('galaxy'), [second.pk, first.pk])
+
+        value = link.attribute_value
+        value.value = 'Midnight'
+        value.save()
+        self.assertEqual(self.search('midnight'), [third.pk])
+
+        second.delete()
+        self.assertEqual(self.search('galaxy'), [first.pk])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_truncated_results_are_reported(self):
+        self.make_products(3)
+        self.assertIs(self.client.get('/Olcha/products/', {'search': 'product'}).json()['search_truncated'], False)
+        with mock.patch.object(ProductSearchFilter, 'max_results', 2):
+            page = self.client.get('/Olcha/products/', {'search': 'product'}).json()
+        self.assertEqual(len(page['results']), 2)
+        self.assertIs(page['search_truncated'], True)
+        self.assertNotIn('search_truncated', self.client.get('/Olcha/products/').json())
+
+
+@override_settings(CACHES=NO_CACHE)
+class FacetTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        self.products = [self.make_product() for _ in range(4)]
+        self.ram = Attribute.objects.create(name='RAM')
+        self.small, self.large = AttributeValue.objects.create(value='8GB'), AttributeValue.objects.create(value='16GB')
+        for product, value in zip(self.products, (self.small, self.small, self.large, self.small)):
+            ProductAttribute.objects.create(product=product, attribute=self.ram, attribute_value=value)
+
+    def ram_counts(self, facets):
+        facet = next(facet for facet in facets if facet['attribute_id'] == self.ram.pk)
+        return {value['value']: value['count'] for value in facet['values']}
+
+    def test_filter_and_count_the_current_result_set(self):
+        response = self.client.get('/Olcha/products/', {'attr': f'{self.ram.pk}:{self.large.pk}'}).json()
+        self.assertEqual([row['id'] for row in response['results']], [self.products[2].pk])
+
+        both = [f'{self.ram.pk}:{self.large.pk}', f'{self.ram.pk}:{self.small.pk}']
+        facets = self.client.get('/Olcha/products/facets/', {'attr': both}).json()['facets']
+        self.assertEqual(self.ram_counts(facets), {'8GB': 3, '16GB': 1})
+        self.assertEqual(self.client.get('/Olcha/products/', {'attr': 'ram'}).status_code, 400)
+
+    def test_precomputed_counts_follow_every_write(self):
+        self.assertEqual(self.ram_counts(precomputed_facets()), {'8GB': 3, '16GB': 1})
+
+        link = ProductAttribute.objects.get(product=self.products[0], attribute=self.ram)
+        link.attribute_value = self.large
+        link.save()
+        ProductAttribute.objects.get(product=self.products[1], attribute=self.ram).delete()
+        self.assertEqual(self.ram_counts(precomputed_facets()), {'8GB': 1, '16GB': 2})
+
+        product = self.products[3]
+        product.sub_category = self.products[2].sub_category
+        product.save()
+        scope = product.sub_category_id
+        self.assertEqual(self.ram_counts(precomputed_facets(sub_category_id=scope)), {'8GB': 1, '16GB': 1})
+
+        self.assertEqual(precomputed_facets(), live_facets(Product.objects.all()))
+        rebuild_facet_counts()
+        self.assertEqual(precomputed_facets(), live_facets(Product.objects.all()))
+
+    def test_a_product_is_linked_to_a_value_once(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductAttribute.objects.create(product=self.products[0], attribute=self.ram, attribute_value=self.small)
+        self.assertEqual(self.ram_counts(precomputed_facets()), {'8GB': 3, '16GB': 1})
+        self.assertEqual(precomputed_facets(), live_facets(Product.objects.all()))
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'olcha.cache_backends.TieredCache',
+        'LOCATION': 'tiered-cache-tests',
+        'OPTIONS': {'SHARED': 'shared', 'LOCAL_MAX_ENTRIES': 2},
+    },
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-cache-tests'},
+})
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        self.cache.reset_stats()
+
+    def test_lru_tier_in_front_of_shared_tier(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, {'key': key})
+        stats = self.cache.stats()
+        self.assertEqual((stats['local_entries'], stats['evictions']), (2, 1))
+
+        self.assertEqual(self.cache.get('c'), {'key': 'c'})
+        self.assertEqual(self.cache.get('a'), {'key': 'a'})
+        self.assertEqual(self.cache.get('a'), {'key': 'a'})
+        stats = self.cache.stats()
+        self.assertEqual((stats['local_hits'], stats['shared_hits']), (2, 1))
+
+        self.cache.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNone(caches['shared'].get('a'))
+        self.assertEqual(self.cache.stats()['shared_misses'], 1)
+
+    def test_values_are_copied_not_shared(self):
+        value = {'items': [1]}
+        self.cache.set('k', value)
+        self.cache.get('k')['items'].append(2)
+        self.assertEqual(self.cache.get('k'), value)
+
+    def test_model_versions_skip_the_local_tier(self):
+        version = get_model_versions([Product])[0]
+        self.assertEqual(self.cache.stats()['local_entries'], 0)
+        # Another process bumps the version; this one must see it at once.
+        caches['shared'].set(model_version_key(Product), version + 1, None)
+        self.assertEqual(get_model_versions([Product]), [version + 1])
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_model_version(Product)
+        self.assertGreater(caches['shared'].get(model_version_key(Product)), version + 1)
+        self.assertEqual(self.cache.stats()['local_entries'], 0)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class VersionedResponseCacheTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def quantities(self):
+        return {row['id']: row['quantity'] for row in self.client.get('/Olcha/products/').json()['results']}
+
+    def test_writes_invalidate_only_dependent_responses(self):
+        _, product = self.make_products(2)
+        self.assertEqual(self.quantities()[product.pk], 100)
+        with self.assertNumQueries(0):
+            self.quantities()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_order()
+        with self.assertNumQueries(0):
+            self.quantities()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(product.pk, 4)
+        self.assertEqual(self.quantities()[product.pk], 96)
+
+        product.refresh_from_db()
+        product.price = '12.50'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.client.get('/Olcha/products/').json()['results'][0]['price'], '12.50')
+
+    def test_rolled_back_writes_keep_cached_responses(self):
+        product = self.make_product()
+        self.assertEqual(self.quantities()[product.pk], 100)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(OutOfStock), transaction.atomic():
+                reserve_stock(product.pk, 4)
+                raise OutOfStock(product.pk, 4)
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.quantities()[product.pk], 100)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class OrderIsolationTests(CatalogFixtureMixin, TestCase):
+    def test_orders_are_scoped_and_cached_per_user(self):
+        mine, theirs = self.make_order(), self.make_order()
+        me = self.auth_headers(mine.user)
+
+        self.assertEqual([row['id'] for row in self.client.get('/Olcha/order/', **me).json()['results']], [mine.pk])
+        with self.assertNumQueries(0):
+            self.client.get('/Olcha/order/', **me)
+        other = self.client.get('/Olcha/order/', **self.auth_headers(theirs.user)).json()['results']
+        self.assertEqual([row['id'] for row in other], [theirs.pk])
+        self.assertEqual(self.client.get('/Olcha/order/').status_code, 401)
+        self.assertEqual(self.client.get(f'/Olcha/order-detail/{theirs.pk}/', **me).status_code, 404)
+
+        response = self.client.post('/Olcha/orderitem/', {
+            'order': theirs.pk, 'product': self.make_product().pk, 'quantity': 1, 'price': '1.00',
+        }, content_type='application/json', **me)
+        self.assertEqual(response.status_code, 400)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=mine.user, address='Bukhara')
+        self.assertEqual(len(self.client.get('/Olcha/order/', **me).json()['results']), 2)
+
+        # Other users' logins and sign-ups leave my cached orders alone; renaming me does not.
+        with self.captureOnCommitCallbacks(execute=True):
+            update_last_login(None, theirs.user)
+            User.objects.create(username='newcomer')
+        with self.assertNumQueries(0):
+            self.client.get('/Olcha/order/', **me)
+        mine.user.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            mine.user.save()
+        self.assertEqual(self.client.get('/Olcha/order/', **me).json()['results'][0]['username'], 'renamed')
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ConditionalRequestTests(CatalogFixtureMixin, TestCase):
+    def test_unchanged_resources_answer_304_without_queries(self):
+        product = self.make_product()
+        for url in ('/Olcha/products/', f'/Olcha/products-detail/{product.pk}/', '/Olcha/categories/'):
+            response = self.client.get(url)
+            etag = response['ETag']
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            # Versions are finer than HTTP dates, so the ETag is the only validator.
+            self.assertFalse(response.has_header('Last-Modified'))
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date()).status_code, 200)
+
+        etag = self.client.get('/Olcha/products/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Image.objects.create(product=product, image='media/new.png')
+        self.assertEqual(self.client.get('/Olcha/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        etag = self.client.get(f'/Olcha/products-detail/{product.pk}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Image.objects.create(product=product, image='media/newer.png')
+        response = self.client.get(f'/Olcha/products-detail/{product.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(CACHES=NO_CACHE)
+class AsyncCatalogTests(CatalogFixtureMixin, TestCase):
+    def test_async_endpoints_match_the_drf_documents(self):
+        self.make_catalog(3)
+        product = Product.objects.latest('id')
+        self.make_comment(product, rating=3)
+        self.assertEqual(
+            self.client.get(f'/Olcha/async/products/{product.pk}/').json(),
+            self.client.get(f'/Olcha/products-detail/{product.pk}/').json(),
+        )
+        self.assertEqual(self.client.get('/Olcha/async/products/0/').status_code, 404)
+
+        by_id = lambda rows: sorted(rows, key=lambda row: row['id'])
+        for async_url, sync_url in (('/Olcha/async/categories/', '/Olcha/categories/'),
+                                    ('/Olcha/async/products/', '/Olcha/products/'),
+                                    ('/Olcha/async/subcategories/', '/Olcha/subcategory/')):
+            self.assertEqual(by_id(self.client.get(async_url).json()['results']),
+                             by_id(self.client.get(sync_url).json()['results']))
+
+        first = self.client.get('/Olcha/async/products/', {'limit': 2}).json()['results']
+        rest = self.client.get('/Olcha/async/products/', {'after': first[-1]['id']}).json()['results']
+        self.assertEqual(len(first) + len(rest), Product.objects.count())
+
+
+@override_settings(CACHES=NO_CACHE)
+class CatalogExportTests(CatalogFixtureMixin, TestCase):
+    def read(self, response):
+        body = b''.join(response.streaming_content)
+        return gzip.decompress(body) if response.get('Content-Encoding') == 'gzip' else body
+
+    def test_streams_full_and_delta_exports(self):
+        product, _, gone = self.make_products(3)
+        response = self.client.get('/Olcha/products-export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows], list(Product.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(rows[0]['price'], '10.00')
+
+        as_array = json.loads(self.read(self.client.get('/Olcha/products-export/', {'output': 'json'})))
+        self.assertEqual(as_array, rows)
+
+        since = response['X-Export-Started-At']
+        reserve_stock(product.pk, 1)
+        delta = self.read(self.client.get('/Olcha/products-export/', {'since': since})).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in delta], [product.pk])
+
+        gone_id = gone.pk
+        gone.delete()
+        delta = [json.loads(line) for line in self.read(
+            self.client.get('/Olcha/products-export/', {'since': since})
+        ).splitlines()]
+        self.assertEqual([row['id'] for row in delta], [product.pk, gone_id])
+        self.assertIs(delta[1]['deleted'], True)
+        self.assertNotIn('deleted', delta[0])
+        full = self.read(self.client.get('/Olcha/products-export/')).splitlines()
+        self.assertNotIn(gone_id, [json.loads(line)['id'] for line in full])
+
+        self.assertEqual(self.client.get('/Olcha/products-export/', {'since': 'yesterday'}).status_code, 400)
+
+    def test_gzip_follows_accept_encoding_qualities(self):
+        for accept_encoding, compressed in (
+            ('gzip, deflate', True), ('br;q=1.0, gzip;q=0.5', True), ('*', True),
+            ('gzip;q=0', False), ('gzip;q=0.0, *;q=1', False), ('*;q=0', False), ('identity', False), ('', False),
+        ):
+            response = self.client.get('/Olcha/products-export/', HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertEqual(response.get('Content-Encoding') == 'gzip', compressed, accept_encoding)
+
+
+@override_settings(CACHES=NO_CACHE)
+class ProductImportTests(CatalogFixtureMixin, TestCase):
+    def test_upserts_a_csv_batch(self):
+        existing = self.make_product()
+        sub_category = self.make_sub_category()
+        admin = User.objects.create_superuser(username='admin', password='secret')
+        body = '\n'.join([
+            'name,slug,price,quantity,discount,description,sub_category,attributes',
+            f'Renamed,{existing.slug},12.50,7,,new text,{sub_category.slug},Color=Red;Size=XL',
+            f'Zenbook Pro,,999.99,3,5,,{sub_category.pk},Color=Red',
+            f'Zenbook Pro,,899.99,1,0,,{sub_category.pk},',
+            f'Broken,,not a price,1,0,,{sub_category.pk},',
+            'Orphan,,1,1,0,,missing-sub,',
+        ])
+        self.assertEqual(self.client.post('/Olcha/products-import/', body, content_type='text/csv').status_code, 401)
+
+        response = self.client.post('/Olcha/products-import/', body, content_type='text/csv',
+                                    **self.auth_headers(admin))
+        report = response.json()
+        self.assertEqual((report['created'], report['updated'], report['failed']), (2, 1, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [5, 6])
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.quantity, existing.sub_category_id), ('Renamed', 7, sub_category.pk))
+        self.assertEqual(sorted(Product.objects.filter(name='Zenbook Pro').values_list('slug', flat=True)),
+                         ['zenbook-pro', 'zenbook-pro-2'])
+        self.assertEqual(set(get_search_backend().search('zenbook', 10)),
+                         set(Product.objects.filter(name='Zenbook Pro').values_list('id', flat=True)))
+        self.assertEqual(self.facet_count(sub_category, 'Red'), 2)
+
+        # Changing attributes replaces the stale links without their per-row signals.
+        body = '\n'.join([
+            'name,slug,price,quantity,sub_category,attributes',
+            f'Renamed,{existing.slug},12.50,7,{sub_category.slug},Color=Blue',
+        ])
+        with mock.patch('olcha.signals.adjust_product_facets') as adjust:
+            response = self.client.post('/Olcha/products-import/', body, content_type='text/csv',
+                                        **self.auth_headers(admin))
+        self.assertEqual(response.json()['updated'], 1)
+        adjust.assert_not_called()
+        self.assertEqual((self.facet_count(sub_category, 'Red'), self.facet_count(sub_category, 'Blue')), (1, 1))
+        self.assertEqual(get_search_backend().search('blue', 10), [existing.pk])
+        self.assertNotIn(existing.pk, get_search_backend().search('xl', 10))
+
+    def facet_count(self, sub_category, value):
+        value_id = AttributeValue.objects.get(value=value).pk
+        return sum(entry['count'] for facet in precomputed_facets(sub_category_id=sub_category.pk)
+                   for entry in facet['values'] if entry['id'] == value_id)
+
+    def test_save_without_slug_generates_one(self):
+        taken = self.make_product()
+        product = Product.objects.create(name=taken.name, price='1.00', quantity=1, discount=0,
+                                         description='', sub_category=taken.sub_category)
+        self.assertTrue(product.pk)
+        self.assertEqual(product.slug, f'{taken.slug}-2')
+
+    def test_auto_slugged_duplicate_survives_later_saves(self):
+        category = Category.objects.create(name='Laptops', image='images/c.png', slug='laptops')
+        sub_category = SubCategory.objects.create(name='Ultra', image='images/s.png', slug='ultra', category=category)
+        first, second = [
+            Product.objects.create(name='Zenbook', price='1.00', quantity=1, discount=0, description='',
+                                   sub_category=sub_category)
+            for _ in range(2)
+        ]
+        self.assertEqual((first.slug, second.slug), ('zenbook', 'zenbook-2'))
+        second = Product.objects.get(pk=second.pk)
+        second.quantity = 5
+        second.save()
+        self.assertEqual(Product.objects.get(pk=second.pk).slug, 'zenbook-2')
+        # A rename keeps the slug: it is the key imports upsert on.
+        second.name = 'Other'
+        second.save()
+        self.assertEqual(Product.objects.get(pk=second.pk).slug, 'zenbook-2')
+
+    def test_edited_product_is_updated_by_the_next_import(self):
+        sub_category = self.make_sub_category()
+        admin = User.objects.create_superuser(username='admin', password='secret')
+        body = f'name,slug,price,quantity,sub_category\nPhone X,sku-123,100.00,5,{sub_category.slug}'
+        for _ in range(2):
+            response = self.client.post('/Olcha/products-import/', body, content_type='text/csv',
+                                        **self.auth_headers(admin))
+            self.assertEqual(response.json()['failed'], 0)
+            product = Product.objects.get()
+            response = self.client.patch(f'/Olcha/products-detail/{product.pk}/', {'price': '90.00'},
+                                         content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Product.objects.values_list('slug', flat=True)), ['sku-123'])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AttributeDictionaryTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_names_are_unique_and_interned(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = attribute_names.get_or_create({'Color', 'Size'})
+        self.assertEqual(ids, dict(Attribute.objects.values_list('name', 'id')))
+        with self.assertNumQueries(0):
+            self.assertEqual(attribute_names.get_or_create({'Color'}), {'Color': ids['Color']})
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Attribute.objects.create(name='Color')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Attribute.objects.get(pk=ids['Size']).delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(attribute_names.lookup({'Color', 'Size'}), {'Color': ids['Color']})
+
+    def test_facet_filters_accept_names(self):
+        self.link_attribute(self.make_product())
+        link = self.link_attribute(self.make_product())
+        response = self.client.get('/Olcha/products/', {'attr': f'{link.attribute.name}:{link.attribute_value.value}'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [link.product_id])
+        response = self.client.get('/Olcha/products/', {'attr': f'{link.attribute.name}:Missing'})
+        self.assertEqual(response.json()['results'], [])
+
+
+@override_settings(CACHES=NO_CACHE)
+class CompactSerializationTests(CatalogFixtureMixin, TestCase):
+    def test_compact_lists_match_the_model_serializers(self):
+        self.make_catalog(3)
+        Product.objects.filter(pk=Product.objects.latest('id').pk).update(name='Qo\u2028shiq ё', price='1234.50')
+        urls = {
+            views.CategoryViewSet: '/Olcha/categories/',
+            views.ProductViewSet: '/Olcha/products/?ordering=-price',
+            views.CommentViewSet: '/Olcha/comments/?page_size=2',
+        }
+        for view_class, url in urls.items():
+            compact = self.client.get(url)
+            self.assertNotIn(b'\xe2\x80\xa8', compact.content)
+            with mock.patch.object(view_class, 'compact_serializer_class', None):
+                regular = self.client.get(url)
+            self.assertEqual(compact.json(), regular.json())
+            if 'next' in compact.json() and compact.json()['next']:
+                self.assertEqual(self.client.get(compact.json()['next']).json()['results'],
+                                 self.client.get(regular.json()['next']).json()['results'])
+
+
+@override_settings(CACHES=NO_CACHE)
+class SparseFieldsetTests(CatalogFixtureMixin, TestCase):
+    def fetch(self, url, params, queries):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(context.captured_queries), queries)
+        return response.json(), ' '.join(query['sql'] for query in context.captured_queries)
+
+    def test_fields_trim_the_response_and_the_columns(self):
+        self.make_catalog(3)
+        narrow = {'fields': 'id,name,price,discount'}
+        for compact in (ProductCompactSerializer, None):
+            with mock.patch.object(views.ProductViewSet, 'compact_serializer_class', compact):
+                data, sql = self.fetch('/Olcha/products/', narrow, 1)
+            self.assertEqual([set(row) for row in data['results']], [set(narrow['fields'].split(','))] * 3)
+            self.assertNotIn('"description"', sql)
+
+        data, sql = self.fetch('/Olcha/products/', {'exclude': 'description'}, 1)
+        self.assertNotIn('description', data['results'][0])
+        self.assertIn('slug', data['results'][0])
+
+        product = Product.objects.latest('id')
+        data, sql = self.fetch(f'/Olcha/products-detail/{product.pk}/', {'fields': 'id,name,comments'}, 2)
+        self.assertEqual(set(data), {'id', 'name', 'comments'})
+        self.assertNotIn('"description"', sql)
+
+        response = self.client.get('/Olcha/products/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['fields'])
+
+
+def full_scans(sql):
+    """
+    Tables the query reads end to end: a plain ``SCAN`` that is filtered
+    or has to be sorted afterwards. An unfiltered scan that streams rows in
+    their stored order (a plain listing) is not counted.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+    sorts = any(detail.startswith('USE TEMP B-TREE FOR ORDER BY') for detail in details)
+    scans = [detail for detail in details if re.fullmatch(r'SCAN \w+', detail)]
+    return scans if scans and (sorts or ' WHERE ' in sql) else []
+
+
+@override_settings(CACHES=NO_CACHE)
+class QueryPlanTests(CatalogFixtureMixin, TestCase):
+    variants = {
+        '/Olcha/products/': ('', '?ordering=price', '?ordering=-rating', '?attr={attribute_id}:{value_id}'),
+        '/Olcha/comments/': ('', '?ordering=-created_at'),
+    }
+
+    def test_endpoint_queries_use_indexes(self):
+        self.make_catalog(5)
+        product = Product.objects.latest('id')
+        link = ProductAttribute.objects.latest('id')
+        failures = []
+        for template, view_class in budgeted_endpoints():
+            if getattr(view_class, 'query_budget', None) is None:
+                continue
+            headers = {}
+            if IsAuthenticated in view_class.permission_classes:
+                headers = self.auth_headers(Order.objects.latest('id').user)
+            for variant in self.variants.get(template, ('',)):
+                url = (template + variant).format(
+                    pk=view_class.queryset.model.objects.latest('id').pk,
+                    category_id=product.sub_category.category_id, subcategory_id=product.sub_category_id,
+                    attribute_id=link.attribute_id, value_id=link.attribute_value_id,
+                )
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(url, **headers).status_code, 200, url)
+                for query in queries:
+                    scans = full_scans(query['sql'])
+                    if scans:
+                        failures.append(f"{url}: {', '.join(scans)}\n    {query['sql']}")
+        self.assertFalse(failures, '\n'.join(failures))
+
+
+class SQLiteProfileTests(TestCase):
+    def test_new_connections_get_the_production_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory, 'profile.sqlite3')}
+            wrapper = connections['default'].__class__(settings_dict, alias='profile')
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 1)
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], settings.OLCHA_SQLITE_PRAGMAS['busy_timeout'])
+            finally:
+                wrapper.close()
+
+
+@override_settings(CACHES=NO_CACHE)
+class StatelessAuthenticationTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        user_cache.clear()
+
+    def test_reads_never_load_the_user(self):
+        user = self.make_order(products=self.make_products(2)).user
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/Olcha/orderitem/', **self.auth_headers(user)).status_code, 200)
+        self.assertFalse([q['sql'] for q in queries if 'auth_user' in q['sql']])
+
+    def test_writes_load_the_user_once_and_see_deactivation(self):
+        user = self.make_user()
+        product = self.make_product()
+        body = {'address': 'Tashkent', 'items': [{'product': product.pk, 'quantity': 1}]}
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/Olcha/checkout/', body, content_type='application/json',
+                                            **self.auth_headers(user))
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(response.json()['username'], user.username)
+            user_loads = [q['sql'] for q in queries if 'FROM "auth_user"' in q['sql']]
+            self.assertEqual(len(user_loads), 0 if _ else 1)
+        user.is_active = False
+        user.save()
+        response = self.client.post('/Olcha/checkout/', body, content_type='application/json',
+                                    **self.auth_headers(user))
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        recent_logins.clear()
+
+    def login(self, username, password, ip='10.0.0.1'):
+        return self.client.post('/Olcha/Login-tokens/', {'username': username, 'password': password},
+                                content_type='application/json', REMOTE_ADDR=ip)
+
+    def test_register_and_login_hash_in_the_pool(self):
+        response = self.client.post('/Olcha/register-token/', {'username': 'alice', 'password': 's3cret-pass'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(User.objects.get(username='alice').check_password('s3cret-pass'))
+        self.assertEqual(self.login('alice', 'wrong').status_code, 401)
+        self.assertEqual(self.login('alice', 's3cret-pass').status_code, 200)
+        # The repeat login is answered from the recent-logins cache without hashing.
+        with mock.patch.object(passwords.pool, 'run', return_value=(False, None)) as run:
+            self.assertEqual(self.login('alice', 's3cret-pass').status_code, 200)
+            self.assertEqual(self.login('alice', 'wrong-again').status_code, 401)
+        self.assertEqual(run.call_count, 1)
+
+    def test_username_is_throttled_across_ips(self):
+        User.objects.create(username='bob', password=passwords.hash_password('right-pass'))
+        with mock.patch.object(passwords.pool, 'run', return_value=(False, None)):
+            statuses = [self.login('bob', 'guess', ip=f'10.0.1.{i}').status_code for i in range(11)]
+        self.assertEqual(statuses, [401] * 10 + [429])
+
+    def test_full_queue_is_throttled_not_queued(self):
+        User.objects.create(username='carol', password='pbkdf2_sha256$1$salt$hash')
+        with mock.patch.object(passwords.pool, 'run', side_effect=passwords.PasswordQueueFull):
+            response = self.login('carol', 'anything')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+@override_settings(CACHES=NO_CACHE, OLCHA_IMAGE_WORKERS=0)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        buffer = io.BytesIO()
+        PILImage.new('RGBA', (800, 400), (200, 30, 30, 128)).save(buffer, 'PNG')
+        self.name = default_storage.save('images/banner.png', ContentFile(buffer.getvalue()))
+
+    def test_upload_renders_variants_and_serializers_expose_srcset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Phones', image=self.name, slug='phones')
+        with default_storage.open(variant_name(self.name, 160, 'webp')) as file, PILImage.open(file) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (160, 80)))
+        with default_storage.open(variant_name(self.name, 1280, 'jpeg')) as file, PILImage.open(file) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (800, 400)))
+
+        category = self.client.get('/Olcha/categories/').json()['results'][0]
+        self.assertIn('/variants/images/banner.160w.webp 160w', category['srcset']['webp'])
+        self.assertIn('/variants/images/banner.1280w.jpg 1280w', category['srcset']['jpeg'])
+
+    def test_variants_live_in_the_media_storage(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        media = {'BACKEND': 'olcha.media.ContentAddressedStorage',
+                 'OPTIONS': {'location': location.name, 'base_url': '/cdn/'}}
+        with override_settings(STORAGES={**settings.STORAGES, 'media': media}):
+            name = media_storage().save('images/banner.png', default_storage.open(self.name))
+            self.assertEqual(render_variants(name), 8)
+            self.assertTrue(media_storage().exists(variant_name(name, 160, 'webp')))
+            self.assertFalse(default_storage.exists(variant_name(name, 160, 'webp')))
+            self.assertTrue(srcset(None, name)['webp'].startswith(f"/cdn/{variant_name(name, 160, 'webp')} 160w"))
+
+    def test_backfill_renders_only_missing_variants(self):
+        Category.objects.create(name='Phones', image=self.name, slug='phones')
+        out = io.StringIO()
+        call_command('generate_image_variants', stdout=out)
+        self.assertIn('1 images, 8 variants written, 0 failed', out.getvalue())
+        call_command('generate_image_variants', stdout=out)
+        self.assertIn('1 images, 0 variants written, 0 failed', out.getvalue())
+
+
+@override_settings(CACHES=NO_CACHE, OLCHA_IMAGE_WORKERS=0)
+class MediaStorageTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (64, 64), (10, 120, 200)).save(buffer, 'PNG')
+        self.photo = buffer.getvalue()
+
+    def test_identical_uploads_share_one_content_addressed_file(self):
+        first, second = self.make_products(2)
+        a = Image.objects.create(product=first, image=ContentFile(self.photo, name='front.PNG'))
+        b = Image.objects.create(product=second, image=ContentFile(self.photo, name='other.png'))
+        self.assertEqual(a.image.name, b.image.name)
+        self.assertRegex(a.image.name, HASHED_NAME)
+        self.assertEqual(os.listdir(os.path.dirname(a.image.path)), [os.path.basename(a.image.name)])
+
+        response = self.client.get(f'/media/{a.image.name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.photo)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], f'"{HASHED_NAME.match(a.image.name)["digest"]}"')
+        self.assertEqual(self.client.get(f'/media/{a.image.name}', HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         304)
+        self.assertEqual(self.client.get('/media/../config/settings.py').status_code, 404)
+
+        with override_settings(OLCHA_MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(f'/media/{a.image.name}')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{a.image.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_re_rendered_variants_get_a_new_etag(self):
+        image = Image.objects.create(product=self.make_product(), image=ContentFile(self.photo, name='front.png'))
+        render_variants(image.image.name)
+        url = f"/media/{variant_name(image.image.name, 160, 'webp')}"
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, must-revalidate')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        with mock.patch.dict(VARIANT_FORMATS, webp=('WEBP', 'webp', {'quality': 10})):
+            render_variants(image.image.name, force=True)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_hash_media_moves_legacy_uploads(self):
+        legacy = default_storage.save('media/legacy.png', ContentFile(self.photo))
+        Image.objects.create(product=self.make_product(), image=legacy)
+        self.assertEqual(self.client.get(f'/media/{legacy}')['Cache-Control'], 'public, max-age=0, must-revalidate')
+        out = io.StringIO()
+        call_command('hash_media', '--delete', stdout=out, stderr=io.StringIO())
+        self.assertIn('1 images moved', out.getvalue())
+        self.assertRegex(Image.objects.latest('id').image.name, HASHED_NAME)
+        self.assertFalse(default_storage.exists(legacy))
+
+
+@override_settings(CACHES=NO_CACHE)
+class TaskQueueTests(CatalogFixtureMixin, TestCase):
+    def test_unknown_previous_ratings_queue_one_coalesced_recount(self):
+        product = self.make_product()
+        comment = self.make_comment(product)
+        for rating in (1, 2, 3):
+            # Built without loading, so the signal cannot tell the previous rating.
+            Comment(pk=comment.pk, user_id=comment.user_id, product=product, comment='edited', rating=rating,
+                    created_at=comment.created_at).save()
+        self.assertEqual(Task.objects.filter(name='recount_product_ratings').count(), 1)
+
+        with mock.patch.dict(handlers, recount_product_ratings=mock.Mock(wraps=handlers['recount_product_ratings'])):
+            self.assertEqual(run_pending(), 1)
+            handlers['recount_product_ratings'].assert_called_once_with([str(product.pk)])
+        product.refresh_from_db()
+        self.assertEqual((product.rating_sum, product.rating_count, product.rating), (3, 1, 3))
+        self.assertFalse(Task.objects.exists())
+
+    def test_claims_do_not_overlap(self):
+        enqueue('flaky', 1, 2, 3)
+        first, second = claim(2), claim(10)
+        self.assertEqual([row['key'] for row in first], ['1', '2'])
+        self.assertEqual([row['key'] for row in second], ['3'])
+        self.assertEqual(claim(10), [])
+
+        # An expired lease is claimed again, by exactly one worker.
+        Task.objects.filter(key='1').update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([row['key'] for row in claim(10)], ['1'])
+        self.assertEqual(claim(10), [])
+
+    @override_settings(OLCHA_TASK_MAX_ATTEMPTS=2, OLCHA_TASK_RETRY_DELAY=0)
+    def test_failures_are_retried_then_kept(self):
+        failing = mock.Mock(side_effect=RuntimeError('boom'))
+        with mock.patch.dict(handlers, flaky=failing), self.assertLogs('olcha.tasks', 'WARNING'):
+            enqueue('flaky', 1)
+            self.assertEqual(run_pending(), 0)
+            self.assertEqual(failing.call_count, 2)
+        task = Task.objects.get(name='flaky')
+        self.assertEqual((task.attempts, task.run_after, task.claimed_until), (2, None, None))
+        self.assertIn('boom', task.last_error)
+        # A dead task does not block the same work from being queued again.
+        enqueue('flaky', 1)
+        self.assertEqual(Task.objects.filter(name='flaky').count(), 2)
+
+        # Dead tasks are pruned once they are past the retention period.
+        with override_settings(OLCHA_TASK_RETENTION=60), mock.patch.dict(handlers, flaky=mock.Mock()):
+            self.assertEqual(run_pending(), 1)
+            self.assertEqual(Task.objects.get().pk, task.pk)
+            Task.objects.update(updated_at=timezone.now() - timedelta(seconds=61))
+            self.assertEqual(run_pending(), 0)
+        self.assertFalse(Task.objects.exists())
@@ -0,0 +1,16 @@
+from rest_framework.throttling import ScopedRateThrottle
+
+
+class UsernameRateThrottle(ScopedRateThrottle):
+    """
+    ScopedRateThrottle keyed on the submitted ``username`` instead of the
+    client, so spreading guesses for one account over many IPs does not
+    raise its budget. The view names the rate with ``username_throttle_scope``.
+    """
+    scope_attr = 'username_throttle_scope'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username')
+        if not isinstance(username, str) or not username:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': username.lower()}
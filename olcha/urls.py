@@ -1,6 +1,6 @@
 from django.urls import path,include
 from rest_framework.routers import DefaultRouter
-from olcha import views, customobtainview
+from olcha import views, customobtainview, async_views
 app_name = 'olcha'
 
 router = DefaultRouter()
@@ -16,14 +16,27 @@ urlpatterns = [
 
 # ----------------------------------------------- Product --------------------------------------------------------
     path('products-detail/<int:pk>/', views.ProductDetailViewSet.as_view(), name='product'),
+    path('products-export/', views.CatalogExportView.as_view(), name='product-export'),
+    path('products-import/', views.ProductImportView.as_view(), name='product-import'),
 
 
 # ----------------------------------------------- Categories --------------------------------------------------------
     path('categories/<int:category_id>/subcategories/', views.SubCategoryViewSet.as_view({'get': 'list'}), name='subcategory-list'),
     path('categories/<int:category_id>/subcategories/<int:subcategory_id>/product/', views.ProductViewSet.as_view({'get': 'list'}), name='product-list'),
+    path('categories/<int:category_id>/subcategories/<int:subcategory_id>/product/facets/', views.ProductViewSet.as_view({'get': 'facets'}), name='product-facets'),
+
+
+# ----------------------------------------------- Async catalog --------------------------------------------------------
+    path('async/categories/', async_views.category_list, name='async-category-list'),
+    path('async/categories/<int:category_id>/subcategories/', async_views.sub_category_list, name='async-subcategory-list'),
+    path('async/subcategories/', async_views.sub_category_list, name='async-subcategory-list-all'),
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/categories/<int:category_id>/subcategories/<int:subcategory_id>/product/', async_views.product_list, name='async-product-sublist'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
 
 
 # ----------------------------------------------- Order --------------------------------------------------------
+    path('checkout/', views.CheckoutView.as_view(), name='checkout'),
     path('order-detail/<int:pk>/', views.OrderDetailViewSet.as_view(), name='order-detail'),
     path('order-item-detail/<int:pk>/', views.OrderItemDetailViewSet.as_view(), name='order-detail'),
 
@@ -1,28 +1,49 @@
-from django.contrib.auth import authenticate
+from django.db.models import Count, Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from jazzmin.templatetags.jazzmin import User
 from rest_framework import status
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, Throttled, ValidationError
 from rest_framework.generics import RetrieveUpdateDestroyAPIView
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
-from olcha.models import Category, SubCategory, Product, Comment, Order, OrderItem
+from olcha.authentication import get_full_user
+from olcha.compact import CompactJSONRenderer
+from olcha.cache import get_product_detail, set_product_detail, versioned_cache_page
+from olcha.export import EXPORT_FORMATS, accepts_gzip, export_catalog, parse_since
+from olcha.importer import ProductImporter, CSVRowsParser, NDJSONRowsParser
+from olcha.facets import AttributeFacetFilter, parse_facet_filters, live_facets, precomputed_facets
+from olcha.mixins import QueryBudgetMixin, OwnerScopedMixin, CompactListMixin, SparseFieldsetMixin
+from olcha.models import Category, SubCategory, Product, Comment, Order, OrderItem, ProductAttribute, Image, \
+    Attribute, AttributeValue
+from olcha.pagination import CreatedAtCursorPagination
+from olcha.passwords import PasswordQueueFull, hash_password, verify_password
 from olcha.permissions import CrudPermission
+from olcha.search import ProductSearchFilter
+from olcha.throttles import UsernameRateThrottle
 from olcha.serializer import CategorySerializer, SubCategorySerializer, ProductSerializer, ProductDetailSerializer, \
-    CommentSerializer, OrderSerializer, OrderItemSerializer, OrderItemDetailSerializer
+    CommentSerializer, OrderSerializer, OrderItemSerializer, OrderItemDetailSerializer, CheckoutSerializer, \
+    CategoryCompactSerializer, ProductCompactSerializer, CommentCompactSerializer
 from rest_framework.filters import SearchFilter, OrderingFilter
 
 # Create your views here.
 
 # --------------------------------------------- Categories -------------------------------------------------------
-class CategoryViewSet(ModelViewSet):
+class CategoryViewSet(CompactListMixin, QueryBudgetMixin, ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    compact_serializer_class = CategoryCompactSerializer
+    renderer_classes = (CompactJSONRenderer, BrowsableAPIRenderer)
+    annotations = {'subcategories_count': Count('sub_categories')}
+    query_budget = 2
     permission_classes = (CrudPermission,)
     filter_backends = (SearchFilter, OrderingFilter)
     search_fields = ('name', 'id')
@@ -34,23 +55,25 @@ class CategoryViewSet(ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-    @method_decorator(cache_page(60))
+    @method_decorator(versioned_cache_page(Category, SubCategory))
     def dispatch(self, request, *args, **kwargs):
         return super(CategoryViewSet, self).dispatch(request, *args, **kwargs)
 
 
-class SubCategoryViewSet(ModelViewSet):
+class SubCategoryViewSet(QueryBudgetMixin, ModelViewSet):
     queryset = SubCategory.objects.all()
     serializer_class = SubCategorySerializer
+    query_budget = 2
     # permission_classes = (CrudPermission,)
     filter_backends = (SearchFilter, OrderingFilter)
     search_fields = ('name', 'id')
 
     def get_queryset(self):
+        queryset = super().get_queryset()
         category_id = self.kwargs.get('category_id')
         if category_id:
-            return SubCategory.objects.filter(category_id=category_id)
-        return SubCategory.objects.all()
+            queryset = queryset.filter(category_id=category_id)
+        return queryset
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -59,22 +82,25 @@ class SubCategoryViewSet(ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-    @method_decorator(cache_page(60))
+    @method_decorator(versioned_cache_page(SubCategory))
     def dispatch(self, request, *args, **kwargs):
         return super(SubCategoryViewSet, self).dispatch(request, *args, **kwargs)
 
 
 # --------------------------------------------- Products -------------------------------------------------------
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(SparseFieldsetMixin, CompactListMixin, QueryBudgetMixin, ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    compact_serializer_class = ProductCompactSerializer
+    renderer_classes = (CompactJSONRenderer, BrowsableAPIRenderer)
+    query_budget = 1
     permission_classes = (CrudPermission,)
-    filter_backends = (SearchFilter, OrderingFilter)
-    search_fields = ('name', 'rating', 'price','id')
+    pagination_class = CreatedAtCursorPagination
+    filter_backends = (ProductSearchFilter, AttributeFacetFilter, OrderingFilter)
 
     def get_queryset(self):
-        queryset = Product.objects.all().select_related('sub_category').prefetch_related('sub_category')
+        queryset = super().get_queryset()
         category_id = self.kwargs.get('category_id')
         subcategory_id = self.kwargs.get('subcategory_id')
 
@@ -86,23 +112,109 @@ class ProductViewSet(ModelViewSet):
 
         return queryset
 
-    @method_decorator(cache_page(60))
+    @action(detail=False)
+    def facets(self, request, *args, **kwargs):
+        # Without attribute filters or a search the result set is the whole scope, so the counts are precomputed.
+        if parse_facet_filters(request.query_params) or request.query_params.get(ProductSearchFilter.search_param):
+            facets = live_facets(self.filter_queryset(self.get_queryset()))
+        else:
+            facets = precomputed_facets(self.kwargs.get('category_id'), self.kwargs.get('subcategory_id'))
+        return Response({'facets': facets})
+
+    @method_decorator(versioned_cache_page(Product, SubCategory, ProductAttribute, Attribute, AttributeValue))
     def dispatch(self, request, *args, **kwargs):
         return super(ProductViewSet, self).dispatch(request, *args, **kwargs)
 
 
-class ProductDetailViewSet(RetrieveUpdateDestroyAPIView):
+class ProductDetailViewSet(SparseFieldsetMixin, QueryBudgetMixin, RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductDetailSerializer
     permission_classes = (AllowAny,)
+    prefetch_related_fields = (
+        Prefetch('product_attribute',
+                 queryset=ProductAttribute.objects.select_related('attribute', 'attribute_value').order_by('id')),
+        Prefetch('image', queryset=Image.objects.order_by('id')),
+        Prefetch('comments', queryset=Comment.objects.select_related('user').order_by('id')),
+    )
+    query_budget = 4
+
+    def retrieve(self, request, *args, **kwargs):
+        # The assembled document is invalidated by olcha.signals whenever the product, a child row or a
+        # commenter's username changes.
+        origin = request.build_absolute_uri('/')
+        data = get_product_detail(self.kwargs['pk'], origin)
+        if data is not None and self.sparse_fields is not None:
+            data = {name: value for name, value in data.items() if name in self.sparse_fields}
+        elif data is None:
+            data = self.get_serializer(self.get_object()).data
+            if self.sparse_fields is None:
+                set_product_detail(self.kwargs['pk'], origin, data)
+        return Response(data)
+
+    @method_decorator(versioned_cache_page(Product, ProductAttribute, Attribute, AttributeValue, Image, Comment, User))
+    def dispatch(self, request, *args, **kwargs):
+        return super(ProductDetailViewSet, self).dispatch(request, *args, **kwargs)
+
+
+class CatalogExportView(APIView):
+    """
+    Streams the whole catalog as NDJSON (default) or a JSON array: ``?output=ndjson|json``.
+
+    ``?since=<ISO datetime>`` limits the export to products written since
+    then, plus a ``"deleted": true`` row for each product deleted since then;
+    pass the previous export's ``X-Export-Started-At`` to pull deltas.
+    Gzip-compressed when the client accepts it.
+    """
+    permission_classes = (AllowAny,)
+    content_types = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+
+    def get(self, request):
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'output': f'Expected one of {", ".join(EXPORT_FORMATS)}.'})
+        try:
+            since = parse_since(request.query_params.get('since'))
+        except ValueError as error:
+            raise ValidationError({'since': str(error)})
+        compress = accepts_gzip(request.headers.get('Accept-Encoding', ''))
+
+        started_at = timezone.now()
+        response = StreamingHttpResponse(
+            export_catalog(export_format, since, compress), content_type=self.content_types[export_format]
+        )
+        response.headers['X-Export-Started-At'] = started_at.isoformat()
+        response.headers['Vary'] = 'Accept-Encoding'
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+
+class ProductImportView(APIView):
+    """
+    Bulk upsert of products from a ``text/csv`` or ``application/x-ndjson`` body.
+
+    Rows are matched on ``slug``; see olcha.importer.ProductImporter. The
+    response reports created/updated/failed counts, per-row errors and
+    throughput.
+    """
+    permission_classes = (IsAdminUser,)
+    parser_classes = (CSVRowsParser, NDJSONRowsParser)
+
+    def post(self, request):
+        return Response(ProductImporter().run(request.data))
 
 
 # --------------------------------------------- Comments -------------------------------------------------------
 
-class CommentViewSet(ModelViewSet):
+class CommentViewSet(CompactListMixin, QueryBudgetMixin, ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    compact_serializer_class = CommentCompactSerializer
+    renderer_classes = (CompactJSONRenderer, BrowsableAPIRenderer)
+    select_related_fields = ('user',)
+    query_budget = 1
     permission_classes = [AllowAny]
+    pagination_class = CreatedAtCursorPagination
     filter_backends = (SearchFilter, OrderingFilter)
     search_fields = ('user__username','rating','id')
 
@@ -113,17 +225,21 @@ class CommentViewSet(ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-    @method_decorator(cache_page(60))
+    @method_decorator(versioned_cache_page(Comment, User))
     def dispatch(self, request, *args, **kwargs):
         return super(CommentViewSet, self).dispatch(request, *args, **kwargs)
 
 
 # ----------------------------------------------- Order ---------------------------------------------------------
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(OwnerScopedMixin, QueryBudgetMixin, ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
-    permission_classes = [AllowAny]
+    select_related_fields = ('user',)
+    prefetch_related_fields = (Prefetch('items', queryset=OrderItem.objects.order_by('id')),)
+    query_budget = 2
+    permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
     filter_backends = (SearchFilter, OrderingFilter)
     search_fields = ('user__username','is_paid','id')
 
@@ -134,17 +250,22 @@ class OrderViewSet(ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-    @method_decorator(cache_page(60))
+    def perform_create(self, serializer):
+        serializer.save(user=get_full_user(self.request.user))
+
+    @method_decorator(versioned_cache_page(per_user=(Order, OrderItem)))
     def dispatch(self, request, *args, **kwargs):
         return super(OrderViewSet, self).dispatch(request, *args, **kwargs)
 
 
-class OrderItemsViewSet(ModelViewSet):
+class OrderItemsViewSet(OwnerScopedMixin, QueryBudgetMixin, ModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
-    permission_classes = [AllowAny]
+    owner_field = 'order__user'
+    query_budget = 2
+    permission_classes = [IsAuthenticated]
     filter_backends = (SearchFilter, OrderingFilter)
-    search_fields = ('user__username','is_paid','id')
+    search_fields = ('product__name','order__id','id')
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -153,27 +274,44 @@ class OrderItemsViewSet(ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-    @method_decorator(cache_page(60))
+    @method_decorator(versioned_cache_page(per_user=(OrderItem,)))
     def dispatch(self, request, *args, **kwargs):
         return super(OrderItemsViewSet, self).dispatch(request, *args, **kwargs)
 
 
-class OrderDetailViewSet(RetrieveUpdateDestroyAPIView):
+class CheckoutView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = CheckoutSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+
+class OrderDetailViewSet(OwnerScopedMixin, QueryBudgetMixin, RetrieveUpdateDestroyAPIView):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
-    permission_classes = [AllowAny]
+    select_related_fields = ('user',)
+    prefetch_related_fields = (Prefetch('items', queryset=OrderItem.objects.order_by('id')),)
+    query_budget = 2
+    permission_classes = [IsAuthenticated]
 
 
-class OrderItemDetailViewSet(RetrieveUpdateDestroyAPIView):
+class OrderItemDetailViewSet(OwnerScopedMixin, QueryBudgetMixin, RetrieveUpdateDestroyAPIView):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemDetailSerializer
-    permission_classes = [AllowAny]
+    owner_field = 'order__user'
+    query_budget = 1
+    permission_classes = [IsAuthenticated]
 
 # --------------------------------------------- AUTHENTICATION -------------------------------------------------------
 
 class RegisterView(APIView):
     authentication_classes = (JWTAuthentication,)
     permission_classes = (AllowAny,)
+    throttle_classes = (ScopedRateThrottle,)
+    throttle_scope = 'register'
 
     def post(self, request):
         username = request.data['username']
@@ -185,7 +323,11 @@ class RegisterView(APIView):
         if User.objects.filter(username=username).exists():
             return Response({'error': 'Username already exists.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        user = User.objects.create_user(username=username, password=password)
+        try:
+            encoded = hash_password(password)
+        except PasswordQueueFull:
+            raise Throttled(wait=1)
+        user = User.objects.create(username=User.normalize_username(username), password=encoded)
         refresh = RefreshToken.for_user(user)
 
         return Response({
@@ -195,11 +337,25 @@ class RegisterView(APIView):
 
 
 class LoginView(APIView):
+    throttle_classes = (ScopedRateThrottle, UsernameRateThrottle)
+    throttle_scope = 'login'
+    username_throttle_scope = 'login_username'
+
     def post(self, request):
         username = request.data.get('username')
         password = request.data.get('password')
 
-        user = authenticate(username=username, password=password)
+        user = None
+        if isinstance(username, str) and isinstance(password, str):
+            user = User.objects.filter(username=username).first()
+            try:
+                if user is None:
+                    # Same work as a real check, so response time does not reveal which usernames exist.
+                    hash_password(password)
+                elif not (user.is_active and verify_password(user, password)):
+                    user = None
+            except PasswordQueueFull:
+                raise Throttled(wait=1)
 
         if user:
             refresh = RefreshToken.for_user(user)